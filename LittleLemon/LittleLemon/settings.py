@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LittleLemonAPI.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,11 +79,89 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Database profiles, picked with the LITTLELEMON_DB_PROFILE environment variable.
+# `production` lets readers and a writer work concurrently (WAL), makes writers
+# queue for the lock instead of failing with "database is locked", and keeps
+# connections open across requests.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable at every checkpoint rather than every commit, safe with WAL
+    'synchronous': 'NORMAL',
+    # Page cache per connection, negative values are KiB
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+DATABASE_PROFILES = {
+    'development': {},
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds to wait for the write lock (busy_timeout)
+            'timeout': 20,
+            # Take the write lock when a transaction begins, a deferred transaction
+            # upgrading from read to write fails at once when another writer holds it
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+    },
+}
+
+DB_PROFILE = os.environ.get('LITTLELEMON_DB_PROFILE', 'development')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **DATABASE_PROFILES[DB_PROFILE],
+    },
+    # Tables of the database-backed caches (see CACHES), written on every request
+    # by the throttle, so kept away from the main database's write lock.
+    # Create them with `python manage.py createcachetable --database cache`.
+    'cache': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'cache.sqlite3',
+        **DATABASE_PROFILES['production'],
+    },
+}
+
+DATABASE_ROUTERS = ['LittleLemonAPI.routers.CacheRouter']
+
+
+# Caches
+# Anything a write has to invalidate in every worker (roles, tokens, the
+# catalog version), throttle counters and idempotency results use shared
+# caches: tables in the `cache` database without LITTLELEMON_REDIS_URL, Redis
+# with it (recommended with several workers). The per-process default only
+# holds entries that are never stale, like catalog responses keyed by version.
+
+REDIS_URL = os.environ.get('LITTLELEMON_REDIS_URL')
+
+
+def shared_cache(table, max_entries):
+    ''' A cache every worker process sees, `table` in the `cache` database unless Redis is configured '''
+    if REDIS_URL:
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL, 'KEY_PREFIX': table}
+    return {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': table,
+        # The database cache culls a third of the table whenever it's full,
+        # size it above the live entries so that stays rare
+        'OPTIONS': {'MAX_ENTRIES': max_entries},
     }
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Roles, groups and tokens of active users
+    'shared': shared_cache('littlelemon_shared_cache', 50000),
+    # Two counters per client and window
+    'throttle': shared_cache('littlelemon_throttle_cache', 20000),
+    'idempotency': shared_cache('littlelemon_idempotency_cache', 100000),
 }
 
 
@@ -130,14 +210,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Rest Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication'
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'rest_framework.filters.OrderingFilter',
         'rest_framework.filters.SearchFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'LittleLemonAPI.pagination.PageNumberPagination',
     'PAGE_SIZE': 3,
     'DEFAULT_THROTTLE_RATES': {
         'anon': '1/second',
@@ -148,4 +228,17 @@ REST_FRAMEWORK = {
 # Djoser settings
 DJOSER = {
     'USER_ID_FIELD': 'username',
-}
\ No newline at end of file
+}
+
+# Menu search backend (`?search=`): an FTS5 index on SQLite and
+# `LittleLemonAPI.search.LikeBackend` (no index) on other databases.
+# Override with LITTLELEMON_SEARCH = {'BACKEND': '<dotted path>'}
+
+# Request metrics (Server-Timing headers and /metrics)
+# Lower SAMPLE_RATE in production, unsampled requests are only counted.
+# /metrics and the /health details are for staff, or for `Authorization: Bearer <TOKEN>`
+LITTLELEMON_METRICS = {
+    'SAMPLE_RATE': 1.0,
+    'SERVER_TIMING': True,
+    'TOKEN': os.environ.get('LITTLELEMON_METRICS_TOKEN'),
+}
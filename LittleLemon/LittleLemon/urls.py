@@ -17,9 +17,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from LittleLemonAPI.health import health_view
+from LittleLemonAPI.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('LittleLemonAPI.urls')),
     path('api/', include('djoser.urls')),
     path('', include('djoser.urls.authtoken')),
+    path('metrics', metrics_view),
+    path('health', health_view),
 ]
@@ -0,0 +1,286 @@
+import json
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.http import http_date
+from django.views import View
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .authentication import aget_token
+from .caching import (
+    CATALOG_CACHE_TIMEOUT,
+    aget_catalog_version,
+    catalog_cache_key,
+    catalog_fingerprint,
+    catalog_last_modified,
+    not_modified,
+)
+from .models import MenuItem, Category, CartItem, Order, OrderEvent
+from .pagination import KeysetPagination, OrderPagination
+from .roles import MANAGER, DELIVERY_CREW, aget_roles
+from .rendering import CART, CATEGORY, MENUITEM, ORDER
+from .search import MenuSearchFilter
+from .serializers import parse_field_options
+from .throttling import AnonRateThrottle, UserRateThrottle
+
+
+# ----- Base ----------------------------
+# --------------------------------------
+class AsyncAPIView(View):
+    '''
+    Async counterpart of the DRF read endpoints, for ASGI deployments.
+    Token/session authentication, throttling and role checks all run without
+    blocking the event loop; querysets, `rendering` shapes and paginators are
+    shared with the sync views.
+    '''
+    http_method_names = ['get', 'head', 'options']
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await self.authenticate(request)
+        if user is None:
+            return self.respond({'detail': 'Invalid token.'}, 401, authenticate=True)
+        request.user = user
+        if not user.is_authenticated:
+            errmsg = 'Authentication credentials were not provided.'
+            return self.respond({'detail': errmsg}, 401, authenticate=True)
+
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                response = self.respond({'detail': 'Request was throttled.'}, 429)
+                wait = throttle.wait()
+                if wait is not None:
+                    response['Retry-After'] = str(int(wait) + 1)
+                return response
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def authenticate(self, request):
+        ''' Returns the user for a `Token` header or the session, None for a bad token '''
+        auth = request.headers.get('Authorization', '').split()
+        if not auth or auth[0].lower() != 'token':
+            return await request.auser()
+        if len(auth) != 2:
+            return None
+        token = await aget_token(auth[1])
+        if token is None or not token.user.is_active:
+            return None
+        return token.user
+
+    async def paginate(self, request, rows, shape):
+        drf_request = Request(request)
+        paginator = self.pagination_class()
+        page = await sync_to_async(paginator.paginate_queryset)(rows, drf_request, view=self)
+        if page is None:
+            return await self.render(shape, rows)
+        return paginator.get_paginated_response(await self.render(shape, page)).data
+
+    async def render(self, shape, rows):
+        ''' `shape.render(rows)`, shapes with children query for them off the event loop '''
+        if shape.children:
+            return await sync_to_async(shape.render)(rows)
+        if isinstance(rows, QuerySet):
+            rows = [row async for row in rows]
+        return shape.render(rows)
+
+    def respond(self, data, status=200, authenticate=False):
+        response = JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+        if authenticate:
+            response['WWW-Authenticate'] = 'Token'
+        return response
+
+
+# ----- Categories and Menu Items  -------
+# --------------------------------------
+class AsyncCatalogView(AsyncAPIView):
+    ''' List and detail reads sharing the versioned catalog cache and its ETags '''
+    queryset = None
+    shape = None
+    filter_backends = api_settings.DEFAULT_FILTER_BACKENDS
+    ordering_fields = None
+    search_fields = None
+
+    async def get(self, request, pk=None):
+        version = await aget_catalog_version()
+        fingerprint = catalog_fingerprint(request, version)
+        etag = f'W/"{fingerprint}"'
+        last_modified = catalog_last_modified(version)
+
+        if not_modified(request, etag, last_modified):
+            response = HttpResponse(status=304)
+        else:
+            key = catalog_cache_key(fingerprint)
+            data = await cache.aget(key)
+            if data is None:
+                data = await (self.list(request) if pk is None else self.retrieve(request, pk))
+                if data is None:
+                    name = self.queryset.model._meta.object_name
+                    return self.respond({'detail': f'No {name} matches the given query.'}, 404)
+                await cache.aset(key, data, CATALOG_CACHE_TIMEOUT)
+            response = self.respond(data)
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_shape(self, request):
+        return self.shape
+
+    def filter_queryset(self, request, queryset):
+        # Off the event loop, backends such as the search index may query
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        return queryset
+
+    async def list(self, request):
+        queryset = await sync_to_async(self.filter_queryset)(Request(request), self.queryset.all())
+        shape = self.get_shape(request)
+        return await self.paginate(request, shape.values(queryset), shape)
+
+    async def retrieve(self, request, pk):
+        shape = self.get_shape(request)
+        row = await shape.values(self.queryset.filter(pk=pk)).afirst()
+        if row is None:
+            return None
+        return (await self.render(shape, [row]))[0]
+
+
+class AsyncCategoryView(AsyncCatalogView):
+    queryset = Category.objects.all()
+    shape = CATEGORY
+    ordering_fields = ['id', 'slug', 'title']
+
+
+class AsyncMenuItemView(AsyncCatalogView):
+    queryset = MenuItem.objects.all()
+    pagination_class = KeysetPagination
+    filter_backends = [MenuSearchFilter, OrderingFilter]
+    ordering_fields = ['price']
+
+    def get_shape(self, request):
+        return MENUITEM.select(*parse_field_options(request))
+
+
+# -------------- Cart  -----------------
+# --------------------------------------
+class AsyncCartView(AsyncAPIView):
+    async def get(self, request):
+        shape = CART.select(*parse_field_options(request))
+        cart_items = CartItem.objects.filter(user=request.user.id)
+        return self.respond(await self.render(shape, shape.values(cart_items)))
+
+
+# -------------- Orders  -----------------
+# ----------------------------------------
+class AsyncOrderView(AsyncAPIView):
+    pagination_class = OrderPagination
+
+    async def get(self, request, pk=None):
+        roles = await aget_roles(request.user)
+        is_manager = request.user.is_staff or MANAGER in roles
+        shape = ORDER.select(*parse_field_options(request))
+        orders = Order.objects.all()
+
+        if pk is None:
+            if not is_manager and DELIVERY_CREW in roles:
+                orders = orders.filter(delivery_crew=request.user.id)
+            elif not is_manager:
+                orders = orders.filter(user=request.user.id)
+            return self.respond(await self.paginate(request, shape.values(orders), shape))
+
+        order = await shape.values(orders.filter(id=pk), 'user_id').afirst()
+        if order is None:
+            return self.respond({'detail': 'No Order matches the given query.'}, 404)
+        if not is_manager and order['user_id'] != request.user.id:
+            return self.respond({'details': "Not Authorized"}, 403)
+        return self.respond((await self.render(shape, [order]))[0])
+
+
+# ----------- Order events  --------------
+# ----------------------------------------
+class AsyncOrderEventsView(AsyncAPIView):
+    '''
+    Server-sent events for order changes: `created`, `assigned`, `status` and
+    `deleted`, each with the order's id, customer, crew and status.
+    Managers get every order, delivery crew the orders assigned to or taken
+    from them, customers their own. Tails the `OrderEvent` log, so events
+    written by any worker reach every stream. Resumes after `Last-Event-ID`
+    (or `?last_event_id=`) and starts at the newest event otherwise. Each
+    stream ends after `?timeout=` seconds (at most `max_duration`), clients
+    then reconnect with the id of the last event they got.
+    '''
+    poll_interval = 1
+    heartbeat = 15
+    max_duration = 300
+    batch_size = 100
+    # Reconnection delay the client is told to use, in ms
+    retry = 1000
+    fields = ('id', 'kind', 'order_id', 'user_id', 'delivery_crew_id', 'previous_delivery_crew_id', 'status', 'created')
+
+    async def get(self, request):
+        try:
+            last_event_id = request.headers.get('Last-Event-ID', request.GET.get('last_event_id'))
+            last_event_id = None if last_event_id is None else int(last_event_id)
+            timeout = min(max(float(request.GET.get('timeout', self.max_duration)), 0), self.max_duration)
+        except ValueError:
+            return self.respond({'details': "Last-Event-ID must be an event ID and timeout a number of seconds"}, 400)
+
+        roles = await aget_roles(request.user)
+        events = OrderEvent.objects.visible_to(
+            request.user,
+            is_manager=request.user.is_staff or MANAGER in roles,
+            is_delivery_crew=DELIVERY_CREW in roles,
+        )
+        if last_event_id is None:
+            last_event_id = await OrderEvent.objects.order_by('-id').values_list('id', flat=True).afirst() or 0
+
+        response = StreamingHttpResponse(self.stream(events, last_event_id, timeout), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Keeps nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, events, last_event_id, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        last_sent = loop.time()
+        yield f'retry: {self.retry}\n\n'
+        while True:
+            batch = [
+                event async for event in
+                events.filter(id__gt=last_event_id).order_by('id').values(*self.fields)[:self.batch_size]
+            ]
+            if batch:
+                last_event_id = batch[-1]['id']
+                last_sent = loop.time()
+                yield ''.join(map(self.format, batch))
+                if len(batch) == self.batch_size:
+                    # More are waiting, don't sleep on a backlog
+                    continue
+
+            now = loop.time()
+            if now >= deadline:
+                return
+            if now - last_sent >= self.heartbeat:
+                last_sent = now
+                yield ': keep-alive\n\n'
+            await asyncio.sleep(min(self.poll_interval, deadline - now))
+
+    def format(self, event):
+        data = {
+            'order': event['order_id'],
+            'user': event['user_id'],
+            'delivery_crew': event['delivery_crew_id'],
+            'previous_delivery_crew': event['previous_delivery_crew_id'],
+            'status': event['status'],
+            'created': event['created'].isoformat(),
+        }
+        return f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,53 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .caching import shared_cache
+
+TOKEN_CACHE_TIMEOUT = 60 * 5
+
+
+def _cache_key(key):
+    return f'littlelemon:token:{key}'
+
+
+def get_token(key):
+    '''
+    The `Token` for `key` with its user, None if there's no such token.
+    Tokens of active users are kept in the shared cache until they're deleted,
+    their user is saved (see `signals.py`) or `TOKEN_CACHE_TIMEOUT` expires.
+    '''
+    cache_key = _cache_key(key)
+    token = shared_cache.get(cache_key)
+    if token is None:
+        token = Token.objects.select_related('user').filter(key=key).first()
+        if token is not None and token.user.is_active:
+            shared_cache.set(cache_key, token, TOKEN_CACHE_TIMEOUT)
+    return token
+
+
+async def aget_token(key):
+    ''' Async version of `get_token` '''
+    cache_key = _cache_key(key)
+    token = await shared_cache.aget(cache_key)
+    if token is None:
+        token = await Token.objects.select_related('user').filter(key=key).afirst()
+        if token is not None and token.user.is_active:
+            await shared_cache.aset(cache_key, token, TOKEN_CACHE_TIMEOUT)
+    return token
+
+
+def invalidate_tokens(keys):
+    shared_cache.delete_many([_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    ''' `TokenAuthentication` that skips the database while the token is cached '''
+    def authenticate_credentials(self, key):
+        token = get_token(key)
+        if token is None:
+            raise AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return (token.user, token)
@@ -0,0 +1,505 @@
+import gc
+import io
+import re
+import time
+import logging
+import asyncio
+import statistics
+import tracemalloc
+from unittest import mock
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connection, connections, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import resolve
+
+from .models import MenuItem, Category, Order
+
+
+class QueryCounter:
+    ''' `execute_wrapper` that counts queries without keeping them around '''
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    ''' Counts the queries of every database in the block, cache tables included '''
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield counter
+
+
+@contextmanager
+def isolated_database(name=None):
+    '''
+    Runs the block in a test environment against freshly migrated throwaway
+    databases, one per alias. `name` gives them files (other aliases get it with
+    their alias appended); SQLite test databases are in memory otherwise.
+    '''
+    old_names, old_test_names = {}, {}
+    setup_test_environment()
+    try:
+        for alias in connections:
+            test_settings = connections[alias].settings_dict['TEST']
+            old_test_names[alias] = test_settings.get('NAME')
+            if name is not None:
+                test_settings['NAME'] = name if alias == DEFAULT_DB_ALIAS else f'{name}-{alias}'
+            # createcachetable ignores verbosity and reports tables that already exist
+            with redirect_stdout(io.StringIO()):
+                old_names[alias] = connections[alias].creation.create_test_db(
+                    verbosity=0, autoclobber=True, serialize=False
+                )
+        yield
+    finally:
+        for alias, old_name in old_names.items():
+            connections[alias].creation.destroy_test_db(old_name, verbosity=0)
+        for alias, old_test_name in old_test_names.items():
+            connections[alias].settings_dict['TEST']['NAME'] = old_test_name
+        teardown_test_environment()
+
+
+@contextmanager
+def database_profile(profile):
+    ''' Applies a `settings.DATABASE_PROFILES` entry to the default database for the block '''
+    settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+    previous = {key: settings_dict[key] for key in profile}
+    connections.close_all()
+    settings_dict.update(profile)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        settings_dict.update(previous)
+
+
+def measure(func, repeat=5):
+    '''
+    Calls `func` `repeat` times.
+    Returns the query count of the last call and the median wall time in ms.
+    '''
+    timings = []
+    for _ in range(repeat):
+        with count_queries() as counter:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+    return counter.count, statistics.median(timings)
+
+
+# ----- Endpoint suite ------------------
+# --------------------------------------
+ROLES = ('manager', 'delivery_crew', 'customer')
+UNREACHABLE_RATES = {'anon': '1000000/second', 'user': '1000000/second'}
+
+
+@dataclass
+class Endpoint:
+    '''
+    One request to benchmark. `path` and `data` may reference values returned
+    by `prepare(users)`, which runs before every call but isn't measured.
+    '''
+    method: str
+    path: str
+    roles: tuple = ROLES
+    data: object = None
+    prepare: object = None
+
+    @property
+    def route(self):
+        ''' The `urls.py` pattern this endpoint exercises '''
+        path = self.path.split('?')[0].removeprefix('/api/')
+        return re.sub(r'\{[^}]+\}', '<int:pk>', path)
+
+    @property
+    def is_async(self):
+        ''' Whether an async view serves it '''
+        view = resolve(re.sub(r'\{[^}]+\}', '1', self.path.split('?')[0])).func
+        return getattr(view, 'view_class', None) is not None and view.view_class.view_is_async
+
+
+def _first_order(users):
+    return {'pk': Order.objects.filter(user=users['customer'][0]).order_by('id').first().id}
+
+def _crew_order(users):
+    return {'pk': Order.objects.filter(delivery_crew=users['delivery_crew'][0]).order_by('id').first().id}
+
+def _empty_category(users):
+    return {'pk': Category.objects.create(slug='empty', title='Empty').id}
+
+def _first_menuitem(users):
+    return {'pk': MenuItem.objects.order_by('id').first().id}
+
+def _menuitem_ids(users):
+    # Small seeds repeat ids, the repeats are then reported as row errors
+    ids = list(MenuItem.objects.order_by('id').values_list('id', flat=True)[:50])
+    params = {f'pk{i}': ids[i % len(ids)] for i in range(50)}
+    return dict(params, category=Category.objects.order_by('id').first().id)
+
+def _pending_orders(users):
+    # Small seeds repeat ids, the repeats are then reported as row errors
+    ids = list(Order.objects.filter(status=False).order_by('date', 'id').values_list('id', flat=True)[:20])
+    params = {f'pk{i}': ids[i % len(ids)] for i in range(20)}
+    return dict(params, crew=users['delivery_crew'][0].id)
+
+def _first_category(users):
+    return {'pk': Category.objects.order_by('id').first().id}
+
+def _group_member(role):
+    return lambda users: {'pk': users[role][-1].id}
+
+def _customer_username(users):
+    return {'username': users['customer'][-1].username}
+
+def _group_changes(role):
+    # Adds 10 customers and removes the last member, small seeds repeat customers
+    def prepare(users):
+        customers = users['customer']
+        params = {f'add{i}': customers[i % len(customers)].username for i in range(10)}
+        return dict(params, remove=users[role][-1].username)
+    return prepare
+
+_bulk_group_changes = {'add': [f'{{add{i}}}' for i in range(10)], 'remove': ['{remove}']}
+
+
+# Reprices 40 items, renames 5, deletes 5 and adds 10
+_bulk_menu_changes = (
+    [{'op': 'update', 'id': f'{{pk{i}}}', 'price': '9.99'} for i in range(40)]
+    + [{'op': 'update', 'id': f'{{pk{i}}}', 'title': 'Renamed'} for i in range(40, 45)]
+    + [{'op': 'delete', 'id': f'{{pk{i}}}'} for i in range(45, 50)]
+    + [{'op': 'create', 'title': f'New {i}', 'price': '5.00', 'featured': False, 'category_id': '{category}'}
+       for i in range(10)]
+)
+
+
+ENDPOINTS = [
+    Endpoint('get', '/api/categories'),
+    Endpoint('post', '/api/categories', ('manager',), {'slug': 'new', 'title': 'New'}),
+    Endpoint('get', '/api/categories/{pk}', prepare=_first_category),
+    Endpoint('patch', '/api/categories/{pk}', ('manager',), {'title': 'Renamed'}, _first_category),
+    Endpoint('delete', '/api/categories/{pk}', ('manager',), prepare=_empty_category),
+
+    Endpoint('get', '/api/menu-items'),
+    Endpoint('get', '/api/menu-items?ordering=price&cursor='),
+    Endpoint('get', '/api/menu-items?expand='),
+    Endpoint('get', '/api/menu-items?search=item+4'),
+    Endpoint('post', '/api/menu-items', ('manager',),
+             {'title': 'New', 'price': '9.99', 'featured': False, 'category_id': '{pk}'}, _first_category),
+    Endpoint('get', '/api/menu-items/{pk}', prepare=_first_menuitem),
+    Endpoint('patch', '/api/menu-items/{pk}', ('manager',), {'price': '1.23'}, _first_menuitem),
+    Endpoint('delete', '/api/menu-items/{pk}', ('manager',), prepare=_first_menuitem),
+    Endpoint('post', '/api/menu-items/bulk', ('manager',), _bulk_menu_changes, _menuitem_ids),
+
+    Endpoint('get', '/api/cart/menu-items', ('customer',)),
+    Endpoint('post', '/api/cart/menu-items', ('customer',), {'menuitem': '{pk}', 'quantity': 2}, _first_menuitem),
+    Endpoint('delete', '/api/cart/menu-items', ('customer',)),
+    Endpoint('post', '/api/cart/menu-items/batch', ('customer',),
+             [{'menuitem': '{pk}', 'quantity': 1}], _first_menuitem),
+
+    Endpoint('get', '/api/orders'),
+    Endpoint('get', '/api/orders?cursor='),
+    Endpoint('get', '/api/orders?fields=id,status,total&expand='),
+    Endpoint('post', '/api/orders', ('customer',)),
+    Endpoint('get', '/api/orders/{pk}', ('manager', 'customer'), prepare=_first_order),
+    Endpoint('patch', '/api/orders/{pk}', ('manager',), {'status': True}, _first_order),
+    Endpoint('patch', '/api/orders/{pk}', ('delivery_crew',), {'status': True}, _crew_order),
+    Endpoint('delete', '/api/orders/{pk}', ('manager',), prepare=_first_order),
+    Endpoint('get', '/api/orders/export', ('manager',)),
+    Endpoint('get', '/api/orders/export?format=csv', ('manager',)),
+    Endpoint('get', '/api/orders/events?last_event_id=0&timeout=0'),
+
+    Endpoint('get', '/api/dispatch', ('manager',)),
+    Endpoint('post', '/api/dispatch', ('manager',),
+             [{'order': f'{{pk{i}}}', 'delivery_crew': '{crew}'} for i in range(20)], _pending_orders),
+    Endpoint('post', '/api/dispatch/balance', ('manager',)),
+
+    Endpoint('get', '/api/reports/sales', ('manager',)),
+    Endpoint('get', '/api/reports/sales?group_by=category', ('manager',)),
+
+    Endpoint('get', '/api/groups/manager/users', ('manager',)),
+    Endpoint('post', '/api/groups/manager/users', ('manager',), {'username': '{username}'}, _customer_username),
+    Endpoint('delete', '/api/groups/manager/users/{pk}', ('manager',), prepare=_group_member('manager')),
+    Endpoint('post', '/api/groups/manager/users/bulk', ('manager',), _bulk_group_changes, _group_changes('manager')),
+    Endpoint('get', '/api/groups/delivery-crew/users', ('manager',)),
+    Endpoint('post', '/api/groups/delivery-crew/users', ('manager',), {'username': '{username}'}, _customer_username),
+    Endpoint('delete', '/api/groups/delivery-crew/users/{pk}', ('manager',), prepare=_group_member('delivery_crew')),
+    Endpoint('post', '/api/groups/delivery-crew/users/bulk', ('manager',),
+             _bulk_group_changes, _group_changes('delivery_crew')),
+
+    Endpoint('get', '/api/async/categories'),
+    Endpoint('get', '/api/async/categories/{pk}', prepare=_first_category),
+    Endpoint('get', '/api/async/menu-items'),
+    Endpoint('get', '/api/async/menu-items/{pk}', prepare=_first_menuitem),
+    Endpoint('get', '/api/async/cart/menu-items', ('customer',)),
+    Endpoint('get', '/api/async/orders'),
+    Endpoint('get', '/api/async/orders/{pk}', ('manager', 'customer'), prepare=_first_order),
+]
+
+
+def token_for(user):
+    from rest_framework.authtoken.models import Token
+    return Token.objects.get_or_create(user=user)[0].key
+
+
+def _fill(value, params):
+    if isinstance(value, str):
+        filled = value.format(**params)
+        return int(filled) if value != filled and filled.isdigit() else filled
+    if isinstance(value, dict):
+        return {key: _fill(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fill(item, params) for item in value]
+    return value
+
+
+def _consume(response):
+    ''' Reads streaming responses to the end so their generation gets measured '''
+    if response.streaming and response.is_async:
+        async def drain():
+            async for _ in response.streaming_content:
+                pass
+        async_to_sync(drain)()
+    elif response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def _percentile(timings, percent):
+    if len(timings) < 2:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method='inclusive')[percent - 1]
+
+
+def run_endpoint(client, endpoint, user, users, repeat=50):
+    '''
+    Calls `endpoint` as `user` once to warm caches, then `repeat` more times.
+    Every call runs in a rolled back transaction so writes don't pile up.
+    Returns status, query count (all databases), p50/p99 latency (ms) and peak allocations (KiB).
+    The query count is the most common one: a throttle window rolling over or
+    a cache entry expiring changes the count of a single call.
+    '''
+    if endpoint.is_async:
+        # Async views do their own authentication, `force_authenticate` doesn't reach them
+        client.force_authenticate(None)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token_for(user)}')
+    else:
+        client.credentials()
+        client.force_authenticate(user)
+    timings, query_counts, status_code, allocations = [], [], None, 0
+    # Keep collector pauses out of the percentiles
+    gc.collect()
+    gc.disable()
+    try:
+        for i in range(repeat + 2):
+            with transaction.atomic():
+                params = endpoint.prepare(users) if endpoint.prepare else {}
+                path, data = _fill(endpoint.path, params), _fill(endpoint.data, params)
+                call = lambda: _consume(getattr(client, endpoint.method)(path, data, format='json'))
+                if i == 0:
+                    call()
+                elif i == 1:
+                    tracemalloc.start()
+                    call()
+                    allocations = tracemalloc.get_traced_memory()[1] / 1024
+                    tracemalloc.stop()
+                else:
+                    with count_queries() as counter:
+                        start = time.perf_counter()
+                        response = call()
+                        timings.append((time.perf_counter() - start) * 1000)
+                    query_counts.append(counter.count)
+                    status_code = response.status_code
+                transaction.set_rollback(True)
+    finally:
+        gc.enable()
+    return {
+        'status': status_code,
+        'queries': statistics.mode(query_counts) if query_counts else 0,
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+        'alloc_kib': round(allocations, 1),
+    }
+
+
+def run_endpoint_benchmarks(users, repeat=50, endpoints=ENDPOINTS):
+    ''' Runs every endpoint for each of its roles, keyed by "METHOD path [role]" '''
+    from rest_framework.test import APIClient
+    from .throttling import SlidingWindowThrottle
+
+    client = APIClient()
+    results = {}
+    # Throttle checks run and are counted, at limits the repeated calls can't reach
+    with mock.patch.object(SlidingWindowThrottle, 'THROTTLE_RATES', UNREACHABLE_RATES):
+        for endpoint in endpoints:
+            for role in endpoint.roles:
+                key = f'{endpoint.method.upper()} {endpoint.path} [{role}]'
+                results[key] = run_endpoint(client, endpoint, users[role][0], users, repeat)
+    return results
+
+
+def compare(results, baseline, latency_tolerance=1.0, alloc_tolerance=0.25):
+    '''
+    Returns a list of regressions of `results` against `baseline`.
+    Query counts must not grow at all, p50 latency and allocations may grow by
+    the given fraction (latency is noisy, hence the generous default).
+    p99 is only reported: a few dozen samples can't pin it down.
+    '''
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if current['status'] != previous['status']:
+            regressions.append(f"{key}: status {previous['status']} -> {current['status']}")
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{key}: queries {previous['queries']} -> {current['queries']}")
+        for metric, tolerance in (('p50_ms', latency_tolerance), ('alloc_kib', alloc_tolerance)):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {previous[metric]} -> {current[metric]}")
+    return regressions
+
+
+# ----- WSGI vs ASGI load ---------------
+# --------------------------------------
+def _summary(timings, elapsed):
+    return {
+        'requests': len(timings),
+        'rps': round(len(timings) / elapsed, 1),
+        'p50_ms': round(_percentile(timings, 50), 3),
+        'p99_ms': round(_percentile(timings, 99), 3),
+    }
+
+
+def run_wsgi_load(requests, workers=8):
+    '''
+    Sends `requests` ((path, token) pairs) through the sync views from a pool
+    of `workers` threads, the way a threaded WSGI server would serve them.
+    '''
+    from django.test import Client
+
+    def call(request):
+        path, token = request
+        start = time.perf_counter()
+        try:
+            response = Client().get(path, headers={'Authorization': f'Token {token}'})
+        finally:
+            connections.close_all()
+        assert response.status_code == 200, (path, response.status_code)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        timings = list(executor.map(call, requests))
+    return _summary(timings, time.perf_counter() - start)
+
+
+def run_asgi_load(requests, concurrency=64):
+    '''
+    Sends `requests` through the async views on a single event loop with at
+    most `concurrency` requests in flight.
+    '''
+    from django.test import AsyncClient
+
+    async def main():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(request):
+            path, token = request
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, headers={'Authorization': f'Token {token}'})
+                assert response.status_code == 200, (path, response.status_code)
+                return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*map(call, requests))
+        return _summary(timings, time.perf_counter() - start)
+
+    return asyncio.run(main())
+
+
+def run_load_comparison(users, paths, total=500, workers=8, concurrency=64):
+    '''
+    Replays the same mix of `paths` (as each role in `users`) against the sync
+    routes and their `/api/async/` counterparts. Returns {'wsgi': ..., 'asgi': ...}.
+    '''
+    from .throttling import SlidingWindowThrottle
+
+    tokens = [token_for(user) for role in ROLES for user in users[role]]
+    requests = [(paths[i % len(paths)], tokens[i % len(tokens)]) for i in range(total)]
+    async_requests = [(path.replace('/api/', '/api/async/', 1), token) for path, token in requests]
+
+    with mock.patch.object(SlidingWindowThrottle, 'allow_request', return_value=True):
+        return {
+            'wsgi': run_wsgi_load(requests, workers),
+            'asgi': run_asgi_load(async_requests, concurrency),
+        }
+
+
+def run_database_load(users, seconds=5, writers=4, readers=8):
+    '''
+    Runs checkouts (add to cart, then place the order) from `writers` threads
+    and order/cart reads from `readers` threads for `seconds`, through the sync
+    views. Connections are kept or closed after every request as the request
+    cycle would, following `CONN_MAX_AGE`.
+    Returns {'writer': ..., 'reader': ...} with "database is locked" failures counted as `errors`.
+    '''
+    from django.test import Client
+    from .throttling import SlidingWindowThrottle
+
+    menuitem = MenuItem.objects.order_by('id').values_list('id', flat=True).first()
+    customers = [token_for(user) for user in users['customer']]
+
+    def checkout(client):
+        client.post('/api/cart/menu-items', {'menuitem': menuitem}, content_type='application/json')
+        return client.post('/api/orders')
+
+    def read(client):
+        client.get('/api/cart/menu-items')
+        return client.get('/api/orders')
+
+    def work(role, i, deadline):
+        client = Client(headers={'Authorization': f'Token {customers[i % len(customers)]}'})
+        operation = checkout if role == 'writer' else read
+        timings, errors = [], 0
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    operation(client)
+                    timings.append((time.perf_counter() - start) * 1000)
+                except OperationalError:
+                    errors += 1
+                finally:
+                    close_old_connections()
+        finally:
+            connections.close_all()
+        return role, timings, errors
+
+    roles = ['writer'] * writers + ['reader'] * readers
+    # Failed requests are counted, not logged with their traceback
+    request_logger = logging.getLogger('django.request')
+    with mock.patch.object(SlidingWindowThrottle, 'allow_request', return_value=True), \
+            mock.patch.object(request_logger, 'disabled', True):
+        deadline = time.perf_counter() + seconds
+        with ThreadPoolExecutor(max_workers=len(roles)) as executor:
+            done = list(executor.map(work, roles, range(len(roles)), [deadline] * len(roles)))
+
+    results = {}
+    for role in ('writer', 'reader'):
+        timings = [timing for done_role, role_timings, _ in done if done_role == role for timing in role_timings]
+        summary = _summary(timings, seconds) if timings else {'requests': 0, 'rps': 0.0, 'p50_ms': None, 'p99_ms': None}
+        summary['errors'] = sum(errors for done_role, _, errors in done if done_role == role)
+        results[role] = summary
+    return results
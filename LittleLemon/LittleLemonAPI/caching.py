@@ -0,0 +1,140 @@
+import time
+import hashlib
+
+from django.core.cache import cache, caches
+from django.utils.connection import ConnectionProxy
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+SHARED_CACHE = 'shared'
+CATALOG_CACHE_TIMEOUT = 60 * 10
+
+# Seen by every worker process, for entries a write has to invalidate everywhere
+shared_cache = ConnectionProxy(caches, SHARED_CACHE)
+
+_CATALOG_VERSION_KEY = 'littlelemon:catalog:version'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    '''
+    Milliseconds since the epoch at the last catalog write, kept in the shared
+    cache so every worker agrees on it. Doubles as the cache version.
+    '''
+    version = shared_cache.get(_CATALOG_VERSION_KEY)
+    if version is None:
+        shared_cache.add(_CATALOG_VERSION_KEY, _now_ms(), None)
+        version = shared_cache.get(_CATALOG_VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version():
+    version = await shared_cache.aget(_CATALOG_VERSION_KEY)
+    if version is None:
+        await shared_cache.aadd(_CATALOG_VERSION_KEY, _now_ms(), None)
+        version = await shared_cache.aget(_CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    '''
+    Invalidates every cached catalog response, in every worker. Moves the
+    version up to the current time, or on by 1 ms if it's there already,
+    with `incr` so concurrent writes can't end up on the same version.
+    '''
+    now = _now_ms()
+    version = shared_cache.get(_CATALOG_VERSION_KEY)
+    if version is None and shared_cache.add(_CATALOG_VERSION_KEY, now, None):
+        return
+    try:
+        shared_cache.incr(_CATALOG_VERSION_KEY, max(now - (version or now), 1))
+    except ValueError:
+        # Evicted since the read
+        shared_cache.add(_CATALOG_VERSION_KEY, now, None)
+
+
+def catalog_last_modified(version):
+    '''
+    Last-Modified of the catalog at `version`, in whole seconds like HTTP dates.
+    None until that second is over: a later write within it would get the same
+    date, and a client sending it back in If-Modified-Since a false 304.
+    '''
+    last_modified = version // 1000
+    return last_modified if time.time() >= last_modified + 1 else None
+
+
+def catalog_fingerprint(request, version):
+    ''' Identifies one representation: host, path, sorted query params and version '''
+    params = sorted(request.GET.lists())
+    return hashlib.md5(
+        f'{request.get_host()}{request.path}{params}{version}'.encode()
+    ).hexdigest()
+
+
+def catalog_cache_key(fingerprint):
+    return f'littlelemon:catalog:{fingerprint}'
+
+
+def not_modified(request, etag, last_modified):
+    ''' Evaluates If-None-Match, or If-Modified-Since when there is no ETag to match '''
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if if_modified_since is None or last_modified is None:
+        return False
+    return last_modified <= if_modified_since
+
+
+class CatalogCacheMixin:
+    '''
+    Caches the serialized data of `list` and `retrieve` per catalog version,
+    keyed on the path and query params (ordering, search, page...).
+    Writes through `perform_create/update/destroy` bump the version.
+    Responses carry ETag/Last-Modified and conditional GETs get a 304.
+    '''
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        bump_catalog_version()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_catalog_version()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        bump_catalog_version()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = get_catalog_version()
+        fingerprint = catalog_fingerprint(request, version)
+        etag = f'W/"{fingerprint}"'
+        last_modified = catalog_last_modified(version)
+
+        if not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = catalog_cache_key(fingerprint)
+            data = cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(key, response.data, CATALOG_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,79 @@
+import heapq
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, Count, Q, Value, When
+
+from .models import Order, OrderEvent
+from .roles import DELIVERY_CREW
+
+
+def crew_load():
+    '''
+    Every active delivery crew member with their number of pending orders,
+    least loaded first, as one aggregate query.
+    '''
+    return (
+        # `delivery_crew` is the reverse accessor of `Order.delivery_crew`
+        User.objects.filter(groups__name=DELIVERY_CREW, is_active=True)
+        .annotate(pending=Count('delivery_crew', filter=Q(delivery_crew__status=False)))
+        .values('id', 'username', 'pending')
+        .order_by('pending', 'id')
+    )
+
+
+def valid_crew(user_ids):
+    ''' The subset of `user_ids` that are active delivery crew members, in one query '''
+    crew = User.objects.filter(id__in=user_ids, groups__name=DELIVERY_CREW, is_active=True)
+    return set(crew.values_list('id', flat=True))
+
+
+def assign(assignments):
+    '''
+    Sets `delivery_crew` for many orders with a single UPDATE and logs an
+    `assigned` event for each order whose crew changed; meant to run in the
+    caller's transaction. `assignments` maps order ids to crew ids; nothing
+    is validated here.
+    '''
+    if not assignments:
+        return 0
+    orders = Order.objects.filter(id__in=assignments)
+    events = [
+        OrderEvent(
+            kind=OrderEvent.ASSIGNED, order_id=order['id'], user_id=order['user_id'],
+            delivery_crew_id=assignments[order['id']], status=order['status'],
+            previous_delivery_crew_id=order['delivery_crew_id'],
+        )
+        for order in orders.values('id', 'user_id', 'delivery_crew_id', 'status')
+        if order['delivery_crew_id'] != assignments[order['id']]
+    ]
+    updated = orders.update(delivery_crew=Case(
+        *[When(id=order_id, then=Value(crew_id)) for order_id, crew_id in assignments.items()]
+    ))
+    OrderEvent.objects.bulk_create(events)
+    return updated
+
+
+def balance(order_ids=None, limit=1000):
+    '''
+    Assigns pending, unassigned orders (oldest first, all of them or just
+    `order_ids`) to whichever crew member has the fewest pending orders at
+    that point. Returns `{order_id: crew_id}`.
+    '''
+    with transaction.atomic():
+        orders = Order.objects.select_for_update().filter(status=False, delivery_crew__isnull=True)
+        if order_ids is not None:
+            orders = orders.filter(id__in=order_ids)
+        orders = list(orders.order_by('date', 'id').values_list('id', flat=True)[:limit])
+
+        loads = [(crew['pending'], crew['id']) for crew in crew_load()]
+        if not loads or not orders:
+            return {}
+        heapq.heapify(loads)
+        assignments = {}
+        for order_id in orders:
+            pending, crew_id = heapq.heappop(loads)
+            assignments[order_id] = crew_id
+            heapq.heappush(loads, (pending + 1, crew_id))
+        assign(assignments)
+    return assignments
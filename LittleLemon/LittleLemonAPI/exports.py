@@ -0,0 +1,109 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import groupby
+
+from rest_framework.renderers import BaseRenderer
+
+# One row per order item, orders without items get one row of empty item columns
+ORDER_COLUMNS = ['order_id', 'date', 'user_id', 'delivery_crew_id', 'status', 'total']
+ITEM_COLUMNS = ['orderitem_id', 'menuitem_id', 'menuitem_title', 'quantity', 'unit_price', 'price']
+LOOKUPS = [
+    'id', 'date', 'user_id', 'delivery_crew_id', 'status', 'total',
+    'orderitem__id', 'orderitem__menuitem_id', 'orderitem__menuitem__title',
+    'orderitem__quantity', 'orderitem__unit_price', 'orderitem__price',
+]
+CHUNK_SIZE = 2000
+# Lines per chunk handed to the server, one write per line would dominate
+LINES_PER_CHUNK = 500
+
+
+def export_rows(orders):
+    '''
+    Streams `orders` joined to their items as tuples in `ORDER_COLUMNS + ITEM_COLUMNS`
+    order. Uses `iterator()`, so rows are fetched `CHUNK_SIZE` at a time (from a
+    server-side cursor where the database has them) and memory stays flat.
+    '''
+    rows = orders.order_by('id', 'orderitem__id').values_list(*LOOKUPS)
+    return rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _json(value):
+    ''' Decimals as strings and dates in ISO format, like the API responses '''
+    if isinstance(value, Decimal):
+        return f'{value:f}'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _text(value):
+    value = _json(value)
+    return '' if value is None else value
+
+
+class Echo:
+    ''' File-like object for `csv.writer` that hands back the line instead of storing it '''
+    def write(self, value):
+        return value
+
+
+def _chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == LINES_PER_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(ORDER_COLUMNS + ITEM_COLUMNS)
+    for row in rows:
+        yield writer.writerow(map(_text, row))
+
+
+def _ndjson_lines(rows):
+    order_size = len(ORDER_COLUMNS)
+    for _, order_rows in groupby(rows, key=lambda row: row[0]):
+        order_rows = list(order_rows)
+        order = dict(zip(ORDER_COLUMNS, map(_json, order_rows[0][:order_size])))
+        order['orderitems'] = [
+            dict(zip(ITEM_COLUMNS, map(_json, row[order_size:])))
+            for row in order_rows if row[order_size] is not None
+        ]
+        yield json.dumps(order) + '\n'
+
+
+def stream_csv(rows):
+    ''' A header, then one line per order item '''
+    return _chunked(_csv_lines(rows))
+
+
+def stream_ndjson(rows):
+    ''' One JSON object per order, with its items under `orderitems` '''
+    return _chunked(_ndjson_lines(rows))
+
+
+class NDJSONRenderer(BaseRenderer):
+    ''' Selects the NDJSON export, only renders errors itself (as one JSON line) '''
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    stream = staticmethod(stream_ndjson)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data) + '\n'
+
+
+class CSVRenderer(BaseRenderer):
+    ''' Selects the CSV export, only renders errors itself (as a header and a row) '''
+    media_type = 'text/csv'
+    format = 'csv'
+    stream = staticmethod(stream_csv)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        writer = csv.writer(Echo())
+        return writer.writerow(list(data)) + writer.writerow(list(data.values()))
@@ -0,0 +1,55 @@
+import logging
+
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+from django.http import JsonResponse
+
+from .metrics import can_view_internals
+
+logger = logging.getLogger(__name__)
+
+
+def check_database(alias):
+    ''' Runs a query on a usable connection; SQLite also reports its journal mode '''
+    connection = connections[alias]
+    # Drops a broken persistent connection (CONN_HEALTH_CHECKS) before the query
+    connection.close_if_unusable_or_obsolete()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        if connection.vendor != 'sqlite':
+            return {'status': 'ok'}
+        cursor.execute('PRAGMA journal_mode')
+        return {'status': 'ok', 'journal_mode': cursor.fetchone()[0]}
+
+
+def health_view(request):
+    '''
+    Health check for load balancers: queries every database and reads every
+    cache. Answers 200 when all of them work and 503 otherwise.
+    Anyone gets the status of each; loopback clients and staff also get the
+    journal mode and error messages, which are logged either way.
+    '''
+    healthy = True
+    report = {'databases': {}, 'caches': {}}
+    for alias in connections:
+        try:
+            report['databases'][alias] = check_database(alias)
+        except DatabaseError as e:
+            healthy = False
+            logger.warning("Health check failed for database %s: %s", alias, e)
+            report['databases'][alias] = {'status': 'error', 'details': str(e)}
+    for alias in caches:
+        try:
+            caches[alias].get('littlelemon:health')
+            report['caches'][alias] = {'status': 'ok'}
+        except Exception as e:
+            healthy = False
+            logger.warning("Health check failed for cache %s: %s", alias, e)
+            report['caches'][alias] = {'status': 'error', 'details': str(e)}
+
+    if not can_view_internals(request):
+        report = {
+            kind: {alias: {'status': result['status']} for alias, result in results.items()}
+            for kind, results in report.items()
+        }
+    return JsonResponse(report, status=200 if healthy else 503)
@@ -0,0 +1,109 @@
+import json
+import time
+import uuid
+import hashlib
+from functools import wraps
+
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_CACHE = 'idempotency'
+# How long a result is replayed for
+IDEMPOTENCY_TTL = 60 * 60 * 24
+# A request holding a key longer than this is assumed to have died
+LOCK_TIMEOUT = 30
+# How long a concurrent duplicate waits for the first request before a 409
+WAIT = 2
+POLL_INTERVAL = 0.05
+MAX_KEY_LENGTH = 255
+
+cache = ConnectionProxy(caches, IDEMPOTENCY_CACHE)
+
+
+def _cache_key(request, key):
+    # Keys are client supplied, hash them into something every cache backend accepts
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'littlelemon:idempotency:{request.user.id}:{digest}'
+
+
+def _fingerprint(request):
+    ''' Identifies the request a key was first used for: method, path and body '''
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method}{request.path}{body}'.encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        errmsg = "Idempotency-Key was already used for a different request"
+        return Response({"details": errmsg}, status.HTTP_422_UNPROCESSABLE_ENTITY)
+    response = Response(stored['data'], stored['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for(result_key, lock_key):
+    ''' The stored result once the request holding the lock is done, None if it takes longer than `WAIT` '''
+    deadline = time.monotonic() + WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        stored = cache.get(result_key)
+        if stored is not None or cache.get(lock_key) is None:
+            return stored
+    return None
+
+
+def idempotent(handler):
+    '''
+    Honours an `Idempotency-Key` header on a view method, per user.
+    The first response (anything but a 5xx) is stored in the shared
+    `idempotency` cache and replayed, with `Idempotent-Replayed: true`, to
+    retries within `IDEMPOTENCY_TTL`. A retry arriving while the first request
+    still runs waits up to `WAIT` seconds for its result, then gets a 409.
+    Reusing a key for a different body or endpoint is a 422.
+    Requests without the header run as usual.
+    '''
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            errmsg = f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"
+            return Response({"details": errmsg}, status.HTTP_400_BAD_REQUEST)
+
+        result_key = _cache_key(request, key)
+        lock_key = f'{result_key}:lock'
+        fingerprint = _fingerprint(request)
+
+        stored = cache.get(result_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        # `add` only succeeds for one of several concurrent duplicates
+        lock = uuid.uuid4().hex
+        if not cache.add(lock_key, lock, LOCK_TIMEOUT):
+            stored = _wait_for(result_key, lock_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            errmsg = "A request with this Idempotency-Key is still in progress"
+            response = Response({"details": errmsg}, status.HTTP_409_CONFLICT)
+            response['Retry-After'] = '1'
+            return response
+
+        try:
+            # The first request may have finished between the `get` and the `add`
+            stored = cache.get(result_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            response = handler(view, request, *args, **kwargs)
+            if response.status_code < 500:
+                stored = {'fingerprint': fingerprint, 'status': response.status_code, 'data': response.data}
+                cache.set(result_key, stored, IDEMPOTENCY_TTL)
+            return response
+        finally:
+            # Unless it expired and another request took it over
+            if cache.get(lock_key) == lock:
+                cache.delete(lock_key)
+    return wrapper
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.benchmarks import isolated_database, run_load_comparison
+from LittleLemonAPI.seed import seed
+
+PATHS = ['/api/menu-items', '/api/menu-items?ordering=price&cursor=', '/api/orders', '/api/cart/menu-items']
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database and replays the same read mix against the "
+        "sync views from a thread pool (WSGI) and against the async views on one "
+        "event loop (ASGI), reporting throughput and p50/p99 latency for each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menuitems', type=int, default=200)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=8,
+                            help="WSGI worker threads")
+        parser.add_argument('--concurrency', type=int, default=64,
+                            help="Requests in flight on the ASGI event loop")
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            users = seed(
+                menuitems=options['menuitems'],
+                customers=options['customers'],
+                orders=options['orders'],
+            )
+            results = run_load_comparison(
+                users, PATHS,
+                total=options['requests'],
+                workers=options['workers'],
+                concurrency=options['concurrency'],
+            )
+
+        self.stdout.write(f"{'server':<8} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for server, result in results.items():
+            self.stdout.write(
+                f"{server:<8} {result['requests']:>8} {result['rps']:>8.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+            )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.benchmarks import isolated_database, measure
+from LittleLemonAPI.models import MenuItem
+from LittleLemonAPI.seed import seed_catalog
+from LittleLemonAPI.serializers import MenuItemSerializer
+
+
+class Command(BaseCommand):
+    help = "Compares menu catalog serialization with and without select_related as the menu grows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000, 10000])
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        querysets = {
+            'lazy': MenuItem.objects.all,
+            'select_related': lambda: MenuItem.objects.select_related('category'),
+        }
+        self.stdout.write(f"{'items':>8} {'queryset':>15} {'queries':>8} {'ms':>10}")
+        for size in options['sizes']:
+            with isolated_database():
+                seed_catalog(categories=options['categories'], menuitems=size)
+                for name, queryset in querysets.items():
+                    queries, ms = measure(
+                        lambda: MenuItemSerializer(queryset(), many=True).data,
+                        repeat=options['repeat']
+                    )
+                    self.stdout.write(f"{size:>8} {name:>15} {queries:>8} {ms:>10.2f}")
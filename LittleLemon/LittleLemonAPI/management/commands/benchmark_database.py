@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.benchmarks import database_profile, isolated_database, run_database_load
+from LittleLemonAPI.seed import seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent checkouts and reads against a file database under each "
+        "`DATABASE_PROFILES` entry, reporting throughput, latency and "
+        "\"database is locked\" errors for writers and readers"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=list(settings.DATABASE_PROFILES))
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--customers', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'profile':<12} {'role':<7} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options['profiles']:
+                path = os.path.join(directory, f'{name}.sqlite3')
+                with database_profile(settings.DATABASE_PROFILES[name]), isolated_database(path):
+                    users = seed(customers=options['customers'], orders=200)
+                    results = run_database_load(
+                        users,
+                        seconds=options['seconds'],
+                        writers=options['writers'],
+                        readers=options['readers'],
+                    )
+                for role, result in results.items():
+                    self.stdout.write(
+                        f"{name:<12} {role:<7} {result['requests']:>8} {result['rps']:>8.1f} "
+                        f"{result['p50_ms'] or 0:>8.2f} {result['p99_ms'] or 0:>8.2f} {result['errors']:>7}"
+                    )
@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI.benchmarks import isolated_database, run_endpoint_benchmarks, compare
+from LittleLemonAPI.seed import seed
+
+BASELINE = Path(__file__).resolve().parents[2] / 'benchmark_baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database and records query count, p50/p99 latency and "
+        "allocations for every LittleLemonAPI route and role. Fails when a route "
+        "makes more queries or regresses in p50 or allocations against the "
+        "committed baseline; p99 is only reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--menuitems', type=int, default=200)
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--delivery-crew', type=int, default=5)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--items-per-cart', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--baseline', type=Path, default=BASELINE)
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Overwrite the baseline with this run instead of comparing")
+        parser.add_argument('--latency-tolerance', type=float, default=1.0)
+        parser.add_argument('--alloc-tolerance', type=float, default=0.25)
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            users = seed(
+                categories=options['categories'],
+                menuitems=options['menuitems'],
+                customers=options['customers'],
+                delivery_crew=options['delivery_crew'],
+                orders=options['orders'],
+                items_per_order=options['items_per_order'],
+                items_per_cart=options['items_per_cart'],
+            )
+            results = run_endpoint_benchmarks(users, repeat=options['repeat'])
+
+        self.stdout.write(f"{'endpoint':<60} {'status':>6} {'queries':>8} {'p50 ms':>8} {'p99 ms':>8} {'KiB':>8}")
+        for key, result in results.items():
+            self.stdout.write(
+                f"{key:<60} {result['status']:>6} {result['queries']:>8} "
+                f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['alloc_kib']:>8.1f}"
+            )
+
+        if options['update_baseline'] or not options['baseline'].exists():
+            options['baseline'].write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        baseline = json.loads(options['baseline'].read_text())
+        regressions = compare(
+            results, baseline,
+            latency_tolerance=options['latency_tolerance'],
+            alloc_tolerance=options['alloc_tolerance'],
+        )
+        if regressions:
+            raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
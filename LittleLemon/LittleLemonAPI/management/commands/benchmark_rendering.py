@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.benchmarks import isolated_database, measure
+from LittleLemonAPI.models import MenuItem, Order
+from LittleLemonAPI.rendering import MENUITEM, ORDER
+from LittleLemonAPI.seed import seed
+from LittleLemonAPI.serializers import MenuItemSerializer, OrderSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares rows per second of the DRF serializers and the `rendering` "
+        "shapes on the order and menu item listings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--menuitems', type=int, default=2000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        cases = {
+            'orders': (
+                options['orders'],
+                lambda: OrderSerializer(
+                    Order.objects.select_related('user', 'delivery_crew')
+                    .prefetch_related('orderitem_set__menuitem__category'),
+                    many=True,
+                ).data,
+                lambda: ORDER.render(ORDER.values(Order.objects.all())),
+            ),
+            'menu items': (
+                options['menuitems'],
+                lambda: MenuItemSerializer(MenuItem.objects.select_related('category'), many=True).data,
+                lambda: MENUITEM.render(MENUITEM.values(MenuItem.objects.all())),
+            ),
+        }
+
+        self.stdout.write(f"{'listing':>10} {'renderer':>11} {'rows':>6} {'queries':>8} {'ms':>9} {'rows/s':>9}")
+        with isolated_database():
+            seed(
+                menuitems=options['menuitems'],
+                orders=options['orders'],
+                items_per_order=options['items_per_order'],
+            )
+            for name, (rows, serializer, shape) in cases.items():
+                for renderer, func in (('serializer', serializer), ('shape', shape)):
+                    queries, ms = measure(func, repeat=options['repeat'])
+                    self.stdout.write(
+                        f"{name:>10} {renderer:>11} {rows:>6} {queries:>8} {ms:>9.1f} {rows / ms * 1000:>9.0f}"
+                    )
@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.benchmarks import isolated_database, measure
+from LittleLemonAPI.models import Category, MenuItem
+from LittleLemonAPI.rendering import MENUITEM
+from LittleLemonAPI.search import FTS5Backend, LikeBackend, parse_terms
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the first page of a menu search with the FTS5 index and the "
+        "LIKE scan (what DRF's SearchFilter does) as the menu grows"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--query', default='777')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        terms = parse_terms(options['query'])
+        backends = {'like': LikeBackend(), 'fts5': FTS5Backend()}
+
+        self.stdout.write(f"{'menu items':>10} {'backend':>8} {'matches':>8} {'queries':>8} {'ms':>9}")
+        with isolated_database():
+            categories = Category.objects.bulk_create([
+                Category(slug=f'category-{i}', title=f'Category {i}') for i in range(10)
+            ])
+            size = 0
+            for target in sorted(options['sizes']):
+                MenuItem.objects.bulk_create([
+                    MenuItem(title=f'Dish {i}', price=Decimal('9.99'), featured=False,
+                             category=categories[i % len(categories)])
+                    for i in range(size, target)
+                ], batch_size=1000)
+                size = target
+                backends['fts5'].rebuild()
+
+                for name, backend in backends.items():
+                    def page():
+                        results = backend.search(MenuItem.objects.all(), terms)
+                        return list(MENUITEM.values(results)[:options['page_size']])
+
+                    queries, ms = measure(page, repeat=options['repeat'])
+                    matches = backend.search(MenuItem.objects.all(), terms).count()
+                    self.stdout.write(f"{size:>10} {name:>8} {matches:>8} {queries:>8} {ms:>9.2f}")
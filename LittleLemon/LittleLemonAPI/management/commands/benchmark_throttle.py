@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from rest_framework import throttling
+
+from LittleLemonAPI.benchmarks import isolated_database, measure
+from LittleLemonAPI.throttling import THROTTLE_CACHE, UserRateThrottle
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the cost of one throttle check for DRF's timestamp-list throttle "
+        "and the sliding window throttle, with a key that has already made "
+        "`size` requests in the current window"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000, 10000])
+        parser.add_argument('--checks', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        request = SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk=1))
+        throttles = {
+            'drf list (locmem)': (throttling.UserRateThrottle, caches['default'], self.fill_history),
+            'sliding (locmem)': (UserRateThrottle, caches['default'], self.fill_counter),
+            'sliding (shared)': (UserRateThrottle, caches[THROTTLE_CACHE], self.fill_counter),
+        }
+
+        self.stdout.write(f"{'history':>8} {'throttle':>18} {'queries':>8} {'us/check':>10}")
+        with isolated_database():
+            for size in options['sizes']:
+                for name, (throttle_class, cache, fill) in throttles.items():
+                    # Never reach the limit, every check takes the allowed path
+                    throttle = type('Throttle', (throttle_class,), {
+                        'rate': f"{size * options['checks'] * 10}/hour",
+                        'cache': cache,
+                    })()
+                    cache.clear()
+                    fill(throttle, request, size)
+
+                    def checks():
+                        for _ in range(options['checks']):
+                            throttle.allow_request(request, None)
+
+                    queries, ms = measure(checks, repeat=options['repeat'])
+                    self.stdout.write(
+                        f"{size:>8} {name:>18} {queries / options['checks']:>8.1f} "
+                        f"{ms * 1000 / options['checks']:>10.1f}"
+                    )
+
+    def fill_history(self, throttle, request, size):
+        now = throttle.timer()
+        throttle.cache.set(throttle.get_cache_key(request, None), [now] * size, throttle.duration)
+
+    def fill_counter(self, throttle, request, size):
+        window = int(throttle.timer() // throttle.duration)
+        key = f'{throttle.get_cache_key(request, None)}:{window}'
+        throttle.cache.set(key, size, 2 * throttle.duration)
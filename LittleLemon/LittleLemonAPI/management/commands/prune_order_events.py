@@ -0,0 +1,21 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from LittleLemonAPI.models import OrderEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes order events older than `--days`. Event streams resuming from "
+        "before that miss the deleted events"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        deleted, _ = OrderEvent.objects.prune(before)
+        self.stdout.write(f"Deleted {deleted} order events")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from LittleLemonAPI.search import get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates (if missing) and refills the menu search index of the configured "
+        "backend, e.g. after switching `LITTLELEMON_SEARCH['BACKEND']`. "
+        "`--drop` removes a backend's index instead"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', help="Dotted path of the backend, the configured one by default")
+        parser.add_argument('--drop', action='store_true')
+
+    def handle(self, *args, **options):
+        backend = import_string(options['backend'])() if options['backend'] else get_backend()
+        name = type(backend).__name__
+        if options['drop']:
+            backend.uninstall(connection)
+            self.stdout.write(f"Dropped the {name} index")
+        else:
+            backend.install(connection)
+            self.stdout.write(f"Built the {name} index")
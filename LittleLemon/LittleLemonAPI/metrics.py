@@ -0,0 +1,173 @@
+import hmac
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+PHASES = ('db', 'serialize', 'render', 'throttle')
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_current = contextvars.ContextVar('littlelemon_request_metrics', default=None)
+
+
+class RequestMetrics:
+    ''' Per-request timings in seconds, only created for sampled requests '''
+    def __init__(self):
+        self.queries = 0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._depth = 0
+
+
+def record_query(execute, sql, params, many, context):
+    '''
+    Execute wrapper installed on every database connection (see `signals`).
+    Reports to the request in the current context, which follows the request
+    into the threads ASGI runs sync code in, unlike a wrapper installed
+    around the request on the calling thread's connection.
+    '''
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.phases['db'] += time.perf_counter() - start
+        metrics.queries += 1
+
+def current():
+    return _current.get()
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timer(phase):
+    ''' Adds the time spent in the block to `phase`, nested calls are only counted once '''
+    metrics = _current.get()
+    if metrics is None or metrics._depth:
+        yield
+        return
+    metrics._depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[phase] += time.perf_counter() - start
+        metrics._depth -= 1
+
+
+class TimedRepresentationMixin:
+    ''' Serializer mixin that reports `to_representation` time to the sampled request '''
+    def to_representation(self, instance):
+        if _current.get() is None:
+            return super().to_representation(instance)
+        with timer('serialize'):
+            return super().to_representation(instance)
+
+
+class Registry:
+    ''' In-process aggregates, exported in the Prometheus text format '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.durations = {}
+            self.phases = {}
+            self.queries = {}
+            self.sampled = {}
+
+    def observe(self, view, method, status, duration, metrics=None):
+        with self._lock:
+            key = (view, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            buckets, total, count = self.durations.get(view, ([0] * len(DURATION_BUCKETS), 0.0, 0))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            self.durations[view] = (buckets, total + duration, count + 1)
+
+            if metrics is not None:
+                self.sampled[view] = self.sampled.get(view, 0) + 1
+                self.queries[view] = self.queries.get(view, 0) + metrics.queries
+                for phase, seconds in metrics.phases.items():
+                    self.phases[(view, phase)] = self.phases.get((view, phase), 0.0) + seconds
+
+    def export(self):
+        lines = [
+            '# HELP littlelemon_requests_total Requests handled.',
+            '# TYPE littlelemon_requests_total counter',
+        ]
+        with self._lock:
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'littlelemon_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+
+            lines += [
+                '# HELP littlelemon_request_duration_seconds Time spent handling requests.',
+                '# TYPE littlelemon_request_duration_seconds histogram',
+            ]
+            for view, (buckets, total, count) in sorted(self.durations.items()):
+                for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'littlelemon_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {bucket}')
+                lines.append(f'littlelemon_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {count}')
+                lines.append(f'littlelemon_request_duration_seconds_sum{{view="{view}"}} {total}')
+                lines.append(f'littlelemon_request_duration_seconds_count{{view="{view}"}} {count}')
+
+            lines += [
+                '# HELP littlelemon_sampled_requests_total Requests with a phase breakdown.',
+                '# TYPE littlelemon_sampled_requests_total counter',
+            ]
+            for view, count in sorted(self.sampled.items()):
+                lines.append(f'littlelemon_sampled_requests_total{{view="{view}"}} {count}')
+
+            lines += [
+                '# HELP littlelemon_phase_seconds_total Time spent per phase in sampled requests.',
+                '# TYPE littlelemon_phase_seconds_total counter',
+            ]
+            for (view, phase), seconds in sorted(self.phases.items()):
+                lines.append(f'littlelemon_phase_seconds_total{{view="{view}",phase="{phase}"}} {seconds}')
+
+            lines += [
+                '# HELP littlelemon_db_queries_total Queries issued by sampled requests.',
+                '# TYPE littlelemon_db_queries_total counter',
+            ]
+            for view, count in sorted(self.queries.items()):
+                lines.append(f'littlelemon_db_queries_total{{view="{view}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def can_view_internals(request):
+    '''
+    Whether `request` may read metrics and health details: staff users, or
+    `Authorization: Bearer <LITTLELEMON_METRICS['TOKEN']>` when a token is set.
+    Not the peer address, behind a reverse proxy every client is loopback
+    '''
+    token = getattr(settings, 'LITTLELEMON_METRICS', {}).get('TOKEN')
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode()):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def metrics_view(request):
+    ''' Prometheus scrape endpoint, for staff and scrapers holding the token '''
+    if not can_view_internals(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
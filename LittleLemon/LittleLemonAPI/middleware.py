@@ -0,0 +1,90 @@
+import time
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    '''
+    Records duration, query count and time spent in SQL, serializers,
+    rendering and throttling for each request, along with the view name.
+    Every request is counted; the phase breakdown and the `Server-Timing`
+    header only cover the `SAMPLE_RATE` fraction of requests.
+    Works under both WSGI and ASGI so async views stay on the event loop.
+    Queries are counted by `metrics.record_query`, on every connection.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = getattr(settings, 'LITTLELEMON_METRICS', {})
+        self.sample_rate = config.get('SAMPLE_RATE', 1.0)
+        self.server_timing = config.get('SERVER_TIMING', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        if random.random() >= self.sample_rate:
+            return self.finish(request, self.get_response(request), start)
+
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.activate(request_metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+        return self.finish(request, response, start, request_metrics)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        if random.random() >= self.sample_rate:
+            return self.finish(request, await self.get_response(request), start)
+
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.activate(request_metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+        return self.finish(request, response, start, request_metrics)
+
+    def finish(self, request, response, start, request_metrics=None):
+        duration = time.perf_counter() - start
+        view = self.view_name(request)
+        metrics.registry.observe(view, request.method, response.status_code, duration, request_metrics)
+        if request_metrics is not None and self.server_timing:
+            response['Server-Timing'] = self.server_timing_header(request_metrics, duration)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render right after this hook, time it until the callback
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            start = time.perf_counter()
+            def rendered(response):
+                request_metrics.phases['render'] += time.perf_counter() - start
+            response.add_post_render_callback(rendered)
+        return response
+
+    def view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved'
+        func = match.func
+        return getattr(func, 'view_class', func).__name__
+
+    def server_timing_header(self, request_metrics, duration):
+        entries = [
+            f'{phase};dur={seconds * 1000:.2f}'
+            for phase, seconds in request_metrics.phases.items()
+        ]
+        entries[0] += f';desc="{request_metrics.queries} queries"'
+        entries.append(f'total;dur={duration * 1000:.2f}')
+        return ', '.join(entries)
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_daily_sales(apps, schema_editor):
+    OrderItem = apps.get_model('LittleLemonAPI', 'OrderItem')
+    DailySales = apps.get_model('LittleLemonAPI', 'DailySales')
+    totals = (
+        OrderItem.objects
+        .values('order__date', 'menuitem_id', 'menuitem__category_id')
+        .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('price'))
+        .order_by()
+    )
+    DailySales.objects.bulk_create([
+        DailySales(
+            date=row['order__date'],
+            menuitem_id=row['menuitem_id'],
+            category_id=row['menuitem__category_id'],
+            quantity=row['total_quantity'],
+            revenue=row['total_revenue']
+        )
+        for row in totals.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0002_rename_cart_cartitem'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='category',
+            options={'ordering': ['id']},
+        ),
+        migrations.AlterModelOptions(
+            name='menuitem',
+            options={'ordering': ['id']},
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='LittleLemonAPI.category')),
+                ('menuitem', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='LittleLemonAPI.menuitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['category', 'date'], name='LittleLemon_categor_edd894_idx')],
+                'unique_together': {('date', 'menuitem')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
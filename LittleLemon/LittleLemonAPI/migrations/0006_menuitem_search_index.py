@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Frozen copy of `search.FTS5Backend.install` as it was for this migration.
+# Later index changes go through the backend and `python manage.py search_index`
+TABLE = 'littlelemon_menuitem_search'
+
+
+def create_search_index(apps, schema_editor):
+    ''' Creates and fills the FTS5 menu search index, other databases search without one '''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        "title, category_title, category_slug, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    # Weighted bm25 as `rank`: title, category title, category slug
+    schema_editor.execute(f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', 'bm25(10.0, 2.0, 1.0)')")
+    schema_editor.execute(
+        f'INSERT INTO {TABLE}(rowid, title, category_title, category_slug) '
+        'SELECT m.id, m.title, c.title, c.slug FROM "LittleLemonAPI_menuitem" m '
+        'INNER JOIN "LittleLemonAPI_category" c ON c.id = m.category_id'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0004_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0006_menuitem_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'created'), ('assigned', 'assigned'), ('status', 'status'), ('deleted', 'deleted')], max_length=16)),
+                ('order_id', models.BigIntegerField()),
+                ('user_id', models.IntegerField()),
+                ('delivery_crew_id', models.IntegerField(null=True)),
+                ('previous_delivery_crew_id', models.IntegerField(null=True)),
+                ('status', models.BooleanField()),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'id'], name='LittleLemon_user_id_e1761e_idx'), models.Index(fields=['delivery_crew_id', 'id'], name='LittleLemon_deliver_9eef2d_idx'), models.Index(fields=['previous_delivery_crew_id', 'id'], name='LittleLemon_previou_b881d1_idx')],
+            },
+        ),
+    ]
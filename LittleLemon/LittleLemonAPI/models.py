@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 
 
@@ -17,6 +17,76 @@ class MenuItem(models.Model):
 
     class Meta:
         ordering = ["id"]
+        indexes = [models.Index(fields=['category', 'price'])]
+
+
+class CartItemQuerySet(models.QuerySet):
+    def add(self, user_id, menuitem_id, unit_price, quantity):
+        '''
+        Adds `quantity` of a menu item to a user's cart, incrementing the existing
+        line in the database (no read-modify-write) when there is one.
+        Returns True if a new cart line was created.
+        '''
+        line = self.filter(user_id=user_id, menuitem_id=menuitem_id)
+        new_quantity = models.F('quantity') + quantity
+        increment = {'quantity': new_quantity, 'price': models.F('unit_price') * new_quantity}
+        if line.update(**increment):
+            return False
+        try:
+            with transaction.atomic():
+                self.create(
+                    user_id=user_id,
+                    menuitem_id=menuitem_id,
+                    quantity=quantity,
+                    unit_price=unit_price,
+                    price=unit_price * quantity
+                )
+            return True
+        except IntegrityError:
+            # A concurrent request created the line in the meantime
+            line.update(**increment)
+            return False
+
+    def add_many(self, user_id, lines):
+        '''
+        Bulk version of `add`, `lines` maps menu item ids to (unit_price, quantity).
+        Existing lines are incremented with one UPDATE and new ones are inserted
+        with one INSERT. Returns the ids of the menu items that got a new line.
+        '''
+        with transaction.atomic():
+            user_lines = self.filter(user_id=user_id)
+            existing = set(
+                user_lines.filter(menuitem_id__in=lines).values_list('menuitem_id', flat=True)
+            )
+            if existing:
+                new_quantity = models.Case(*[
+                    models.When(menuitem_id=menuitem_id, then=models.F('quantity') + lines[menuitem_id][1])
+                    for menuitem_id in existing
+                ])
+                user_lines.filter(menuitem_id__in=existing).update(
+                    quantity=new_quantity, price=models.F('unit_price') * new_quantity
+                )
+
+            created = [menuitem_id for menuitem_id in lines if menuitem_id not in existing]
+            try:
+                with transaction.atomic():
+                    self.bulk_create([
+                        CartItem(
+                            user_id=user_id,
+                            menuitem_id=menuitem_id,
+                            quantity=lines[menuitem_id][1],
+                            unit_price=lines[menuitem_id][0],
+                            price=lines[menuitem_id][0] * lines[menuitem_id][1]
+                        )
+                        for menuitem_id in created
+                    ])
+            except IntegrityError:
+                # Lost a race on at least one line, settle them one by one
+                created = [
+                    menuitem_id for menuitem_id in created
+                    if self.add(user_id, menuitem_id, *lines[menuitem_id])
+                ]
+        return set(created)
 
 
 class CartItem(models.Model):
@@ -26,8 +96,12 @@ class CartItem(models.Model):
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ('menuitem', 'user')
+        # Cart reads, checkout and upserts all filter on the user first
+        indexes = [models.Index(fields=['user', 'menuitem'])]
 
 
 class Order(models.Model):
@@ -38,6 +112,17 @@ class Order(models.Model):
     date = models.DateField(db_index=True)
 
 
+    class Meta:
+        indexes = [
+            # Customer and delivery crew listings, newest first
+            models.Index(fields=['user', '-date', '-id']),
+            models.Index(fields=['delivery_crew', '-date', '-id']),
+            # Pending/delivered lookups per crew and per day
+            models.Index(fields=['delivery_crew', 'status']),
+            models.Index(fields=['date', 'status']),
+        ]
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -46,4 +131,156 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
     class Meta:
-        unique_together = ('order', 'menuitem')
\ No newline at end of file
+        unique_together = ('order', 'menuitem')
+
+class DailySalesQuerySet(models.QuerySet):
+    def rebuild(self):
+        ''' Recomputes every row from `OrderItem`, for seeding or repairing drift '''
+        totals = (
+            OrderItem.objects
+            .values('order__date', 'menuitem_id', 'menuitem__category_id')
+            .annotate(total_quantity=models.Sum('quantity'), total_revenue=models.Sum('price'))
+            .order_by()
+        )
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([
+                DailySales(
+                    date=row['order__date'],
+                    menuitem_id=row['menuitem_id'],
+                    category_id=row['menuitem__category_id'],
+                    quantity=row['total_quantity'],
+                    revenue=row['total_revenue']
+                )
+                for row in totals.iterator()
+            ], batch_size=500)
+
+    def record(self, date, lines, sign=1):
+        '''
+        Adds (or with `sign=-1` removes) sold order lines to the summary for `date`.
+        `lines` is an iterable of (menuitem_id, category_id, quantity, price).
+        Rows are incremented in the database, one UPDATE for the existing ones
+        and one INSERT for the rest.
+        '''
+        totals = {}
+        for menuitem_id, category_id, quantity, price in lines:
+            _, total_quantity, revenue = totals.get(menuitem_id, (None, 0, 0))
+            totals[menuitem_id] = (category_id, total_quantity + sign * quantity, revenue + sign * price)
+
+        with transaction.atomic():
+            day = self.filter(date=date)
+            existing = set(day.filter(menuitem_id__in=totals).values_list('menuitem_id', flat=True))
+            if existing:
+                day.filter(menuitem_id__in=existing).update(
+                    quantity=models.Case(*[
+                        models.When(menuitem_id=menuitem_id, then=models.F('quantity') + totals[menuitem_id][1])
+                        for menuitem_id in existing
+                    ]),
+                    revenue=models.Case(*[
+                        models.When(menuitem_id=menuitem_id, then=models.F('revenue') + totals[menuitem_id][2])
+                        for menuitem_id in existing
+                    ]),
+                )
+            missing = [menuitem_id for menuitem_id in totals if menuitem_id not in existing]
+            try:
+                with transaction.atomic():
+                    self.bulk_create([
+                        DailySales(
+                            date=date,
+                            menuitem_id=menuitem_id,
+                            category_id=totals[menuitem_id][0],
+                            quantity=totals[menuitem_id][1],
+                            revenue=totals[menuitem_id][2]
+                        )
+                        for menuitem_id in missing
+                    ])
+            except IntegrityError:
+                # Another checkout created some of the rows first
+                for menuitem_id in missing:
+                    category_id, quantity, revenue = totals[menuitem_id]
+                    self.record(date, [(menuitem_id, category_id, quantity, revenue)])
+
+
+class DailySales(models.Model):
+    '''
+    Sales per day and menu item, maintained on checkout and order deletion
+    so reports never have to scan `OrderItem`.
+    '''
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.SET_NULL, null=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    objects = DailySalesQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+        indexes = [models.Index(fields=['category', 'date'])]
+
+
+class OrderEventQuerySet(models.QuerySet):
+    def visible_to(self, user, is_manager=False, is_delivery_crew=False):
+        ''' Managers see every event, delivery crew their assignments, customers their own orders '''
+        if is_manager:
+            return self
+        if is_delivery_crew:
+            return self.filter(models.Q(delivery_crew_id=user.id) | models.Q(previous_delivery_crew_id=user.id))
+        return self.filter(user_id=user.id)
+
+    def prune(self, before):
+        ''' Drops events created before `before`, they can no longer be resumed from '''
+        return self.filter(created__lt=before).delete()
+
+
+class OrderEvent(models.Model):
+    '''
+    Append-only log of order changes, tailed by the order event stream.
+    The ids are the stream's event ids. Orders and users are kept as plain ids
+    so the log outlives deleted orders.
+    '''
+    CREATED = 'created'
+    ASSIGNED = 'assigned'
+    STATUS = 'status'
+    DELETED = 'deleted'
+    KINDS = [(kind, kind) for kind in (CREATED, ASSIGNED, STATUS, DELETED)]
+
+    kind = models.CharField(max_length=16, choices=KINDS)
+    order_id = models.BigIntegerField()
+    user_id = models.IntegerField()
+    delivery_crew_id = models.IntegerField(null=True)
+    # Set on reassignments, so the crew losing the order hears about it
+    previous_delivery_crew_id = models.IntegerField(null=True)
+    status = models.BooleanField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = OrderEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Tailing the log per customer and per crew member
+            models.Index(fields=['user_id', 'id']),
+            models.Index(fields=['delivery_crew_id', 'id']),
+            models.Index(fields=['previous_delivery_crew_id', 'id']),
+        ]
+
+    @classmethod
+    def for_order(cls, kind, order, previous_delivery_crew_id=None):
+        return cls(
+            kind=kind,
+            order_id=order.id,
+            user_id=order.user_id,
+            delivery_crew_id=order.delivery_crew_id,
+            previous_delivery_crew_id=previous_delivery_crew_id,
+            status=order.status,
+        )
+
+    @classmethod
+    def for_changes(cls, order, delivery_crew_id, status):
+        ''' Events for what changed on `order` since it had `delivery_crew_id` and `status` '''
+        events = []
+        if order.delivery_crew_id != delivery_crew_id:
+            events.append(cls.for_order(cls.ASSIGNED, order, previous_delivery_crew_id=delivery_crew_id))
+        if order.status != status:
+            events.append(cls.for_order(cls.STATUS, order))
+        return events
@@ -0,0 +1,191 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PageNumberPagination(pagination.PageNumberPagination):
+    '''
+    Page number pagination with a client-selectable page size.
+    `?count=false` skips the COUNT(*) query, the response then has no `count`.
+    '''
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.skip_count = request.query_params.get(self.count_query_param) == 'false'
+        if not self.skip_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param) or 1)
+            if self.page_number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * page_size
+        results = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(results) > page_size
+        return results[:page_size]
+
+    def get_next_link(self):
+        if not self.skip_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if not self.skip_count:
+            return super().get_previous_link()
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        if not self.skip_count:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class KeysetPagination(PageNumberPagination):
+    '''
+    Adds a keyset (cursor) mode on top of page numbers, selected by passing
+    `?cursor` (empty for the first page) and then following `next`/`previous`.
+    Pages are fetched with `WHERE (a, id) > (x, y) ORDER BY a, id LIMIT n`,
+    so deep pages cost the same as the first one and nothing is counted.
+    Works on model and `.values()` querysets alike.
+
+    `ordering` is the default keyset; an `OrderingFilter` on the view can
+    replace it. `id` is always appended as the tie-breaker.
+    '''
+    ordering = ('id',)
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            if not queryset.ordered:
+                queryset = queryset.order_by(*self.ordering)
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.keyset = self.get_keyset(request, queryset, view)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self.keyset
+        if reverse:
+            ordering = [(field, not descending) for field, descending in ordering]
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+        queryset = queryset.order_by(*[
+            f'-{field}' if descending else field for field, descending in ordering
+        ])
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.results = results
+        return results
+
+    def get_keyset(self, request, queryset, view):
+        ordering = self.ordering
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view) or ordering
+                break
+        keyset = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+        if 'id' not in [field for field, _ in keyset]:
+            keyset.append(('id', keyset[-1][1]))
+        return keyset
+
+    def after(self, ordering, position):
+        ''' Rows strictly after `position` in `ordering`, as a row-value comparison '''
+        condition = Q()
+        for i, (field, descending) in enumerate(ordering):
+            lookup = f'{field}__lt' if descending else f'{field}__gt'
+            equal = {prev_field: position[j] for j, (prev_field, _) in enumerate(ordering[:i])}
+            condition |= Q(**equal, **{lookup: position[i]})
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+            if len(position) != len(self.keyset):
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse):
+        if isinstance(instance, dict):
+            position = [str(instance[field]) for field, _ in self.keyset]
+        else:
+            position = [str(getattr(instance, field)) for field, _ in self.keyset]
+        cursor = {'p': position, 'r': 1} if reverse else {'p': position}
+        encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.results:
+            return None
+        return self.encode_cursor(self.results[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-date', '-id')
+
+
+class DispatchPagination(KeysetPagination):
+    ''' Pending orders, oldest first '''
+    ordering = ('date', 'id')
@@ -1,11 +1,13 @@
 from rest_framework.permissions import BasePermission
 
+from .roles import MANAGER, DELIVERY_CREW, get_request_roles
+
 class IsManager(BasePermission):
     def has_permission(self, request, view=None):
         # Automatically returns true if SuperUser
         if request.user.is_staff:
             return True
-        return request.user.groups.filter(name="Manager").exists()
+        return MANAGER in get_request_roles(request)
     
 
 class IsDeliveryCrew(BasePermission):
@@ -13,4 +15,4 @@ class IsDeliveryCrew(BasePermission):
         # Automatically returns true if SuperUser
         if request.user.is_staff:
             return True
-        return request.user.groups.filter(name="Delivery crew").exists()
\ No newline at end of file
+        return DELIVERY_CREW in get_request_roles(request)
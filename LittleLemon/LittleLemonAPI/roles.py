@@ -0,0 +1,99 @@
+from urllib.parse import quote
+
+from django.contrib.auth.models import Group, User
+
+from .caching import shared_cache
+
+MANAGER = "Manager"
+DELIVERY_CREW = "Delivery crew"
+
+ROLE_CACHE_TIMEOUT = 60 * 5
+GROUP_CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(user_id):
+    return f'littlelemon:roles:{user_id}'
+
+
+def _group_cache_key(name):
+    # Group names may contain spaces, which memcached keys can't
+    return f'littlelemon:group:{quote(name)}'
+
+
+def get_roles(user):
+    '''
+    Returns the names of every group `user` belongs to.
+    Memberships are loaded with a single query and kept in the shared cache
+    until they change (see `signals.py`) or `ROLE_CACHE_TIMEOUT` expires.
+    '''
+    if not user or not user.is_authenticated:
+        return frozenset()
+    key = _cache_key(user.id)
+    roles = shared_cache.get(key)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        shared_cache.set(key, roles, ROLE_CACHE_TIMEOUT)
+    return roles
+
+
+async def aget_roles(user):
+    ''' Async version of `get_roles` '''
+    if not user or not user.is_authenticated:
+        return frozenset()
+    key = _cache_key(user.id)
+    roles = await shared_cache.aget(key)
+    if roles is None:
+        roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+        await shared_cache.aset(key, roles, ROLE_CACHE_TIMEOUT)
+    return roles
+
+
+def get_request_roles(request):
+    ''' Same as `get_roles` for `request.user`, resolved at most once per request '''
+    roles = getattr(request, '_roles', None)
+    if roles is None:
+        roles = get_roles(request.user)
+        request._roles = roles
+    return roles
+
+
+def invalidate_roles(user_ids):
+    shared_cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+
+def get_group(name):
+    '''
+    The `Group` called `name`, kept in the shared cache until it's saved or
+    deleted (see `signals.py`). Raises `Group.DoesNotExist` like `Group.objects.get`.
+    '''
+    key = _group_cache_key(name)
+    group = shared_cache.get(key)
+    if group is None:
+        group = Group.objects.get(name=name)
+        shared_cache.set(key, group, GROUP_CACHE_TIMEOUT)
+    return group
+
+
+def invalidate_group(name):
+    shared_cache.delete(_group_cache_key(name))
+
+
+def add_members(group, user_ids):
+    '''
+    Adds `user_ids` to `group` with a single INSERT into the through table,
+    existing memberships are left alone.
+    Skips `m2m_changed`, so the cached roles are dropped here.
+    '''
+    Membership = User.groups.through
+    Membership.objects.bulk_create(
+        [Membership(user_id=user_id, group_id=group.id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    invalidate_roles(user_ids)
+
+
+def remove_members(group, user_ids):
+    ''' Removes `user_ids` from `group` with a single DELETE, see `add_members` '''
+    User.groups.through.objects.filter(group_id=group.id, user_id__in=user_ids).delete()
+    invalidate_roles(user_ids)
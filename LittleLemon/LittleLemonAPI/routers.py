@@ -0,0 +1,24 @@
+CACHE_DATABASE = 'cache'
+
+
+class CacheRouter:
+    '''
+    Sends the tables of database-backed caches to the `cache` database and
+    keeps everything else out of it.
+    '''
+    # App label of the models `DatabaseCache` makes for its tables
+    cache_app_label = 'django_cache'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.cache_app_label:
+            return CACHE_DATABASE
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == self.cache_app_label:
+            return db == CACHE_DATABASE
+        if db == CACHE_DATABASE:
+            return False
+        return None
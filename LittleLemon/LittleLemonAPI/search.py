@@ -0,0 +1,175 @@
+import re
+import operator
+from functools import lru_cache, reduce
+
+from django.conf import settings
+from django.db import connection as default_connection
+from django.db.models import Case, Q, Value, When
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .models import Category, MenuItem
+
+TERM = re.compile(r'\w+')
+MAX_TERMS = 8
+# SQLite's default limit on bound parameters was 999 before 3.32
+BATCH_SIZE = 500
+
+
+def parse_terms(query):
+    ''' The lowercased words of a search query, at most `MAX_TERMS` '''
+    return TERM.findall(query.lower())[:MAX_TERMS]
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+class SearchBackend:
+    '''
+    Searches menu items by their title and their category's title and slug.
+    Every term has to match; `search` returns the matching items best match first.
+    Backends that keep an index are told about menu writes through `index` and `remove`.
+    '''
+    # Database vendors the backend works on, None for any
+    vendors = None
+    def install(self, connection):
+        ''' Creates and fills the index, safe to run again '''
+
+    def uninstall(self, connection):
+        pass
+
+    def search(self, queryset, terms):
+        raise NotImplementedError
+
+    def index(self, menuitem_ids):
+        ''' (Re)indexes these menu items after they were created or changed '''
+
+    def remove(self, menuitem_ids):
+        pass
+
+    def rebuild(self, connection=default_connection):
+        pass
+
+
+class LikeBackend(SearchBackend):
+    '''
+    Index-free fallback for any database. Terms match anywhere in a field
+    (`LIKE '%term%'`), items whose title has every term come first.
+    Scans the whole menu, so only meant for small menus.
+    '''
+    fields = ('title', 'category__title', 'category__slug')
+
+    def search(self, queryset, terms):
+        matches = reduce(operator.and_, [
+            reduce(operator.or_, [Q(**{f'{field}__icontains': term}) for field in self.fields])
+            for term in terms
+        ])
+        in_title = reduce(operator.and_, [Q(title__icontains=term) for term in terms])
+        rank = Case(When(in_title, then=Value(0)), default=Value(1))
+        return queryset.filter(matches).annotate(search_rank=rank).order_by('search_rank', 'id')
+
+
+class FTS5Backend(SearchBackend):
+    '''
+    SQLite FTS5 index with one row per menu item, keyed by its id.
+    Terms match word prefixes ("chick" finds "Chicken"), served by the 2 and 3
+    character prefix indexes. Matches are ranked with bm25, a title match
+    weighing more than a category match.
+    '''
+    vendors = ('sqlite',)
+    table = 'littlelemon_menuitem_search'
+    # title, category title, category slug
+    weights = (10.0, 2.0, 1.0)
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "title, category_title, category_slug, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+            # Makes `rank` (and `ORDER BY rank`) use the weighted bm25
+            weights = ', '.join(map(str, self.weights))
+            cursor.execute(f"INSERT INTO {self.table}({self.table}, rank) VALUES ('rank', %s)", [f'bm25({weights})'])
+        self.rebuild(connection)
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def documents(self, connection):
+        ''' SELECT of the indexed columns for every menu item, to be narrowed with a WHERE '''
+        quote = connection.ops.quote_name
+        menuitem, category = quote(MenuItem._meta.db_table), quote(Category._meta.db_table)
+        return (
+            f'SELECT m.id, m.title, c.title, c.slug FROM {menuitem} m '
+            f'INNER JOIN {category} c ON c.id = m.category_id'
+        )
+
+    def search(self, queryset, terms):
+        # Joins the index, so FTS5 expands the prefix terms once per query;
+        # ranking each row in a correlated subquery would expand them for every row
+        match = ' '.join(f'"{term}"*' for term in terms)
+        quote = default_connection.ops.quote_name
+        menuitem_id = f'{quote(MenuItem._meta.db_table)}.{quote("id")}'
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table}.rowid = {menuitem_id}', f'{self.table} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'{self.table}.rank'},
+        ).order_by('search_rank', 'id')
+
+    def index(self, menuitem_ids):
+        insert = f'INSERT INTO {self.table}(rowid, title, category_title, category_slug) '
+        with default_connection.cursor() as cursor:
+            for batch in _batches(menuitem_ids):
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', batch)
+                cursor.execute(
+                    f'{insert}{self.documents(default_connection)} WHERE m.id IN ({placeholders})', batch
+                )
+
+    def remove(self, menuitem_ids):
+        with default_connection.cursor() as cursor:
+            for batch in _batches(menuitem_ids):
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', batch)
+
+    def rebuild(self, connection=default_connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table}(rowid, title, category_title, category_slug) '
+                f'{self.documents(connection)}'
+            )
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    '''
+    The `LITTLELEMON_SEARCH['BACKEND']` backend, FTS5 by default.
+    `LikeBackend` on databases the backend doesn't work on.
+    '''
+    config = getattr(settings, 'LITTLELEMON_SEARCH', {})
+    backend = import_string(config['BACKEND']) if 'BACKEND' in config else FTS5Backend
+    if backend.vendors is not None and default_connection.vendor not in backend.vendors:
+        backend = LikeBackend
+    return backend()
+
+
+class MenuSearchFilter(BaseFilterBackend):
+    '''
+    `?search=` over menu item and category titles through the search backend.
+    Results come best match first unless `?ordering=` (applied after) says otherwise.
+    '''
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        terms = parse_terms(request.query_params.get(self.search_param, ''))
+        if not terms:
+            return queryset
+        return get_backend().search(queryset, terms)
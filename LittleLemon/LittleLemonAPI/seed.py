@@ -0,0 +1,97 @@
+import datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User, Group
+
+from .models import MenuItem, Category, CartItem, Order, OrderItem, DailySales
+from .roles import MANAGER, DELIVERY_CREW
+from .search import get_backend
+
+
+def seed_catalog(categories=5, menuitems=50):
+    ''' Bulk inserts `categories` categories and spreads `menuitems` menu items across them '''
+    Category.objects.bulk_create([
+        Category(slug=f'category-{i}', title=f'Category {i}')
+        for i in range(categories)
+    ])
+    category_ids = list(Category.objects.values_list('id', flat=True))
+    MenuItem.objects.bulk_create([
+        MenuItem(
+            title=f'Menu item {i}',
+            price=Decimal(100 + i % 9900) / 100,
+            featured=i % 10 == 0,
+            category_id=category_ids[i % len(category_ids)]
+        )
+        for i in range(menuitems)
+    ], batch_size=500)
+    # bulk_create skips the signals that index menu items one at a time
+    get_backend().rebuild()
+
+
+def seed_users(managers=2, delivery_crew=3, customers=10):
+    '''
+    Creates the role groups and users for each of them.
+    Returns `{'manager': [...], 'delivery_crew': [...], 'customer': [...]}`.
+    '''
+    users = {}
+    for role, group_name, count in (
+        ('manager', MANAGER, managers),
+        ('delivery_crew', DELIVERY_CREW, delivery_crew),
+        ('customer', None, customers),
+    ):
+        User.objects.bulk_create([User(username=f'{role}{i}') for i in range(count)])
+        users[role] = list(User.objects.filter(username__startswith=role).order_by('id'))
+        if group_name:
+            group, _ = Group.objects.get_or_create(name=group_name)
+            group.user_set.add(*users[role])
+    return users
+
+
+def seed_carts(customers, items_per_cart=5):
+    menuitems = list(MenuItem.objects.values_list('id', 'price')[:items_per_cart])
+    CartItem.objects.bulk_create([
+        CartItem(user=customer, menuitem_id=menuitem_id, quantity=1, unit_price=price, price=price)
+        for customer in customers
+        for menuitem_id, price in menuitems
+    ], batch_size=500)
+
+
+def seed_orders(customers, delivery_crew, orders=100, items_per_order=3, days=30):
+    '''
+    Spreads `orders` orders over the last `days` days and the given customers,
+    half of them assigned to delivery crew, then rebuilds the sales summary.
+    '''
+    menuitems = list(MenuItem.objects.values_list('id', 'price'))
+    today = datetime.date.today()
+    new_orders = Order.objects.bulk_create([
+        Order(
+            user=customers[i % len(customers)],
+            delivery_crew=delivery_crew[i // 2 % len(delivery_crew)] if i % 2 else None,
+            status=i % 4 == 3,
+            total=0,
+            date=today - datetime.timedelta(days=i % days)
+        )
+        for i in range(orders)
+    ], batch_size=500)
+
+    order_items = []
+    for i, order in enumerate(new_orders):
+        lines = [menuitems[(i + j) % len(menuitems)] for j in range(items_per_order)]
+        for menuitem_id, price in lines:
+            order_items.append(OrderItem(
+                order=order, menuitem_id=menuitem_id, quantity=1, unit_price=price, price=price
+            ))
+        order.total = sum(price for _, price in lines)
+    OrderItem.objects.bulk_create(order_items, batch_size=500)
+    Order.objects.bulk_update(new_orders, ['total'], batch_size=500)
+    DailySales.objects.rebuild()
+
+
+def seed(categories=5, menuitems=50, customers=10, delivery_crew=3,
+         orders=100, items_per_order=3, items_per_cart=5):
+    ''' Seeds every model at the given scale, returns the users by role '''
+    seed_catalog(categories, menuitems)
+    users = seed_users(delivery_crew=delivery_crew, customers=customers)
+    seed_carts(users['customer'], items_per_cart)
+    seed_orders(users['customer'], users['delivery_crew'], orders, items_per_order)
+    return users
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
+from .metrics import TimedRepresentationMixin
+
 from .models import (
     MenuItem,
     Category,
@@ -9,26 +11,88 @@ from .models import (
     OrderItem
 )
 
-class UserSerializer(serializers.ModelSerializer):
+def parse_field_options(request):
+    '''
+    Returns `(fields, expand)` as sets from `?fields=a,b` and `?expand=a,b.c`,
+    None for a parameter that isn't given. Works on DRF and plain Django requests.
+    '''
+    params = getattr(request, 'query_params', request.GET)
+    options = []
+    for name in ('fields', 'expand'):
+        value = params.get(name)
+        options.append(None if value is None else {part.strip() for part in value.split(',') if part.strip()})
+    return tuple(options)
+
+
+def nested_expand(expand, name):
+    ''' The part of `expand` below relation `name`: {"menuitem.category"} -> {"category"} '''
+    if expand is None:
+        return None
+    prefix = f'{name}.'
+    return {path[len(prefix):] for path in expand if path.startswith(prefix)}
+
+
+def is_expanded(expand, name):
+    ''' Whether relation `name` is nested, itself or through a deeper path '''
+    return expand is None or name in expand or bool(nested_expand(expand, name))
+
+
+class SelectableFieldsMixin:
+    '''
+    Lets clients trim a representation.
+    `fields` keeps only the named top level fields, `expand` names the relations
+    to nest (dotted for deeper ones); the other relations in `expandable`
+    collapse to their id. Without `expand` every relation is nested, as before.
+
+    Options are taken from the `fields`/`expand` kwargs, or else from the
+    query params of `context['request']`.
+    '''
+    # relations that can be nested or collapsed to their id
+    expandable = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if fields is None and expand is None and request is not None:
+            fields, expand = parse_field_options(request)
+        self.select(fields, expand)
+
+    def select(self, fields=None, expand=None):
+        self.expand = expand
+        if fields is not None:
+            for name, field in list(self.fields.items()):
+                if name not in fields and not field.write_only:
+                    self.fields.pop(name)
+        for name in self.expandable:
+            if name not in self.fields:
+                continue
+            if not is_expanded(expand, name):
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+            elif isinstance(self.fields[name], SelectableFieldsMixin):
+                self.fields[name].select(expand=nested_expand(expand, name))
+
+class UserSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'email', 'username']
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'slug', 'title']
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(SelectableFieldsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     category_id = serializers.IntegerField(write_only=True)
     category = CategorySerializer(read_only=True)
+    expandable = ('category',)
+
     class Meta:
         model = MenuItem
         fields = ['id', 'title', 'price', 'featured', 'category', 'category_id']
         
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SelectableFieldsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     '''
     Only needs `quantity` and `menuitem_id` for deserialization,
     the rest is calculated/retrieved in `create`.
@@ -42,6 +106,7 @@ class CartSerializer(serializers.ModelSerializer):
     menuitem = MenuItemSerializer(read_only=True)
     unit_price = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
     price = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
+    expandable = ('menuitem',)
 
     class Meta:
         model = CartItem
@@ -65,7 +130,7 @@ class CartSerializer(serializers.ModelSerializer):
         )
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SelectableFieldsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), write_only=True, source='user'
@@ -76,6 +141,7 @@ class OrderSerializer(serializers.ModelSerializer):
         source='delivery_crew', required=False, allow_null=True
     )
     orderitems = serializers.SerializerMethodField(read_only=True)
+    expandable = ('user', 'delivery_crew')
 
     class Meta:
         model = Order
@@ -85,21 +151,23 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def get_orderitems(self, obj):
         orderitems = obj.orderitem_set.all()
-        return OrderItemSerializer(orderitems, many=True).data
-        
+        expand = nested_expand(self.expand, 'orderitems')
+        return OrderItemSerializer(orderitems, many=True, expand=expand).data
+
     def create(self, validated_data):
         user = validated_data['user']
         date = validated_data['date']
-        total = sum([cartitem.price for cartitem in self.context['cart_items']])
         return Order.objects.create(
             user=user,
-            total=total,
+            total=self.context['total'],
             date=date
         )
         
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SelectableFieldsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     menuitem = MenuItemSerializer(read_only=True)
+    expandable = ('menuitem',)
+
     class Meta:
         model = OrderItem
         fields = ['id', 'menuitem', 'quantity', 'unit_price', 'price']
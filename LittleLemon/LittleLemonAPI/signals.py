@@ -0,0 +1,73 @@
+from django.contrib.auth.models import Group, User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+from .metrics import record_query
+from .models import Category, MenuItem
+from .roles import invalidate_group, invalidate_roles
+from .search import get_backend
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_cached_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    '''
+    Drops cached roles whenever group memberships change, either from the user
+    side (`user.groups.add`) or the group side (`group.user_set.remove`).
+    '''
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_roles([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_roles(instance.user_set.values_list('pk', flat=True))
+    else:
+        invalidate_roles(pk_set)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_cached_group(sender, instance, **kwargs):
+    invalidate_group(instance.name)
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    ''' Covers djoser's logout and token rotation, which delete the user's token '''
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    '''
+    Cached tokens carry their user, drop them whenever the user changes
+    (deactivation, staff status...). Logins only touch `last_login` and are skipped.
+    '''
+    if created or update_fields == {'last_login'}:
+        return
+    invalidate_tokens(Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=MenuItem)
+def index_menuitem(sender, instance, **kwargs):
+    '''
+    Keeps the search index current, bulk writes call the backend themselves.
+    Deletes are unindexed by the views: a post_delete receiver would cost a
+    query per row and take bulk deletes off Django's fast-delete path.
+    '''
+    get_backend().index([instance.id])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, **kwargs):
+    ''' Category titles and slugs are indexed with each of their menu items '''
+    if not created:
+        get_backend().index(MenuItem.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    ''' Counts queries for request metrics, the wrapper stays on the connection across reconnects '''
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
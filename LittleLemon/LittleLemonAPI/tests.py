@@ -1,3 +1,1506 @@
-from django.test import TestCase
+import io
+import os
+import re
+import csv
+import json
+import time
+import datetime
+import tempfile
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.utils import ConnectionHandler, load_backend
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User, Group
+from rest_framework.test import APITestCase
+from rest_framework.authtoken.models import Token
+
+from .models import CartItemQuerySet, MenuItem, Category, CartItem, Order, OrderEvent, OrderItem, DailySales
+from .rendering import CART, MENUITEM, ORDER
+from .serializers import CartSerializer, MenuItemSerializer, OrderSerializer
+from . import idempotency, urls
+from .metrics import registry
+from .benchmarks import ENDPOINTS, UNREACHABLE_RATES, run_endpoint_benchmarks, compare
+from .permissions import IsManager, IsDeliveryCrew
+from .search import FTS5Backend, LikeBackend, get_backend
+from .seed import seed
+from .authentication import get_token
+from .caching import SHARED_CACHE
+from .roles import MANAGER, DELIVERY_CREW, get_group, get_roles
+from .throttling import THROTTLE_CACHE, SlidingWindowThrottle, UserRateThrottle
+
+
+class LittleLemonTestCase(APITestCase):
+    ''' Shared fixtures: one user per role plus a small menu '''
+    databases = {'default', 'cache'}
+
+    def setUp(self):
+        # Throttling isn't under test, checks run against limits no test reaches
+        throttle_patcher = mock.patch.object(SlidingWindowThrottle, 'THROTTLE_RATES', UNREACHABLE_RATES)
+        throttle_patcher.start()
+        self.addCleanup(throttle_patcher.stop)
+        cache.clear()
+
+        manager_group = Group.objects.create(name="Manager")
+        crew_group = Group.objects.create(name="Delivery crew")
+
+        self.manager = User.objects.create_user(username="manager1")
+        self.manager.groups.add(manager_group)
+        self.crew = User.objects.create_user(username="delivery1")
+        self.crew.groups.add(crew_group)
+        self.customer = User.objects.create_user(username="customer1")
+
+        self.categories = [
+            Category.objects.create(slug=f"cat-{i}", title=f"Category {i}")
+            for i in range(2)
+        ]
+        self.menuitems = [
+            MenuItem.objects.create(
+                title=f"Item {i}",
+                price=Decimal("2.50") + i,
+                featured=False,
+                category=self.categories[i % 2]
+            )
+            for i in range(4)
+        ]
+
+    def request(self, method, url, user=None, data=None):
+        self.client.force_authenticate(user)
+        return getattr(self.client, method)(url, data, format='json')
+
+    def fill_cart(self, user, items=None, quantity=1):
+        for item in items or self.menuitems:
+            CartItem.objects.create(
+                user=user, menuitem=item, quantity=quantity,
+                unit_price=item.price, price=item.price * quantity
+            )
+
+    def create_order(self, user, crew=None, items=None):
+        items = items or self.menuitems
+        order = Order.objects.create(
+            user=user,
+            delivery_crew=crew,
+            total=sum(item.price for item in items),
+            date=datetime.date.today()
+        )
+        for item in items:
+            OrderItem.objects.create(
+                order=order, menuitem=item, quantity=1,
+                unit_price=item.price, price=item.price
+            )
+        return order
+
+
+class OrderListQueryCountTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(3):
+            self.create_order(self.customer, crew=self.crew)
+
+    def assert_constant_queries(self, user, expected):
+        url = '/api/orders?page_size=50'
+        # Warm the role cache first
+        self.request('get', url, user)
+        with self.assertNumQueries(expected):
+            response = self.request('get', url, user)
+        self.assertEqual(response.status_code, 200)
+        first_count = len(response.data['results'])
+
+        for _ in range(5):
+            self.create_order(self.customer, crew=self.crew)
+        with self.assertNumQueries(expected):
+            response = self.request('get', url, user)
+        self.assertEqual(len(response.data['results']), first_count + 5)
+
+    # One COUNT(*), one page of orders with users and crew, one prefetch of order items
+    def test_manager_listing(self):
+        self.assert_constant_queries(self.manager, 3)
+
+    def test_delivery_crew_listing(self):
+        self.assert_constant_queries(self.crew, 3)
+
+    def test_customer_listing(self):
+        self.assert_constant_queries(self.customer, 3)
+
+    def test_single_order(self):
+        order = Order.objects.first()
+        with self.assertNumQueries(3):
+            response = self.request('get', f'/api/orders/{order.id}', self.customer)
+        self.assertEqual(len(response.data['orderitems']), len(self.menuitems))
+        self.assertEqual(response.data['orderitems'][0]['menuitem']['category']['id'],
+                         self.menuitems[0].category.id)
+
+
+class CheckoutTests(LittleLemonTestCase):
+    def checkout_queries(self, items):
+        # Same starting point for the sales summary on every run
+        DailySales.objects.all().delete()
+        self.fill_cart(self.customer, items, quantity=2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.request('post', '/api/orders', self.customer)
+        self.assertEqual(response.status_code, 201)
+        return len(ctx.captured_queries)
+
+    def test_checkout_creates_order_and_empties_cart(self):
+        self.fill_cart(self.customer, quantity=2)
+        response = self.request('post', '/api/orders', self.customer)
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(order.total, sum(item.price * 2 for item in self.menuitems))
+        self.assertEqual(order.orderitem_set.count(), len(self.menuitems))
+        self.assertFalse(CartItem.objects.filter(user=self.customer).exists())
+
+    def test_checkout_query_count_is_independent_of_cart_size(self):
+        small = self.checkout_queries(self.menuitems[:1])
+        large = self.checkout_queries(self.menuitems)
+        self.assertEqual(small, large)
+
+    def test_lines_added_during_checkout_stay_in_the_cart(self):
+        self.fill_cart(self.customer, self.menuitems[:2])
+        late = self.menuitems[2]
+        save = OrderSerializer.save
+
+        def add_line_then_save(serializer, **kwargs):
+            # Lands after the cart was read, where row locks don't reach
+            self.fill_cart(self.customer, [late])
+            return save(serializer, **kwargs)
+
+        with mock.patch.object(OrderSerializer, 'save', add_line_then_save):
+            response = self.request('post', '/api/orders', self.customer)
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(order.total, sum(item.price for item in self.menuitems[:2]))
+        self.assertEqual(order.orderitem_set.count(), 2)
+        self.assertEqual(list(CartItem.objects.filter(user=self.customer).values_list('menuitem', flat=True)), [late.id])
+
+    def test_empty_cart(self):
+        response = self.request('post', '/api/orders', self.customer)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failed_checkout_is_rolled_back(self):
+        self.fill_cart(self.customer)
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.request('post', '/api/orders', self.customer)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(user=self.customer).count(), len(self.menuitems))
+
+
+class RoleCacheTests(LittleLemonTestCase):
+    def test_roles_resolved_with_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_roles(self.manager), {MANAGER})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_roles(self.manager), {MANAGER})
+            self.assertEqual(get_roles(self.manager), {MANAGER})
+
+    def test_permission_checks_share_one_lookup_per_request(self):
+        request = mock.Mock(user=self.crew, spec=['user'])
+        with self.assertNumQueries(1):
+            self.assertFalse(IsManager().has_permission(request))
+            self.assertTrue(IsDeliveryCrew().has_permission(request))
+
+    def test_group_endpoints_invalidate_roles(self):
+        self.assertEqual(get_roles(self.customer), frozenset())
+
+        response = self.request('post', '/api/groups/manager/users', self.manager,
+                                {'username': self.customer.username})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_roles(self.customer), {MANAGER})
+
+        response = self.request('delete', f'/api/groups/manager/users/{self.customer.id}', self.manager)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_roles(self.customer), frozenset())
+
+    def test_group_side_clear_invalidates_roles(self):
+        self.assertEqual(get_roles(self.crew), {DELIVERY_CREW})
+        Group.objects.get(name=DELIVERY_CREW).user_set.clear()
+        self.assertEqual(get_roles(self.crew), frozenset())
+
+    def test_cached_in_the_shared_cache(self):
+        # Per-process memory would keep revoked roles in every worker that didn't handle the change
+        self.assertNotIsInstance(caches[SHARED_CACHE], LocMemCache)
+        self.request('post', '/api/groups/manager/users', self.manager, {'username': self.customer.username})
+        self.assertEqual(caches[SHARED_CACHE].get(f'littlelemon:roles:{self.customer.id}'), None)
+        self.assertEqual(get_roles(self.customer), {MANAGER})
+
+
+class TokenCacheTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.manager)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        get_roles(self.manager)
+
+    def assertAuthenticated(self, authenticated=True):
+        response = self.client.get('/api/groups/manager/users')
+        self.assertEqual(response.status_code, 200 if authenticated else 401)
+
+    def test_warm_cache_skips_the_database(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_token(self.token.key).user, self.manager)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_token(self.token.key).user, self.manager)
+
+        self.assertAuthenticated()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertAuthenticated()
+        self.assertFalse([query for query in queries if 'authtoken_token' in query['sql']])
+
+    def test_cached_in_the_shared_cache(self):
+        # A logout in one worker has to reach the others
+        self.assertAuthenticated()
+        self.assertEqual(caches[SHARED_CACHE].get(f'littlelemon:token:{self.token.key}'), self.token)
+
+    def test_logout_invalidates(self):
+        self.assertAuthenticated()
+        response = self.client.post('/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertAuthenticated(False)
+
+    def test_token_rotation_invalidates(self):
+        self.assertAuthenticated()
+        self.token.delete()
+        Token.objects.create(user=self.manager)
+        self.assertAuthenticated(False)
+
+    def test_deactivation_invalidates(self):
+        self.assertAuthenticated()
+        self.manager.is_active = False
+        self.manager.save()
+        self.assertAuthenticated(False)
+        self.assertIsNone(caches[SHARED_CACHE].get(f'littlelemon:token:{self.token.key}'))
+
+    def test_login_keeps_the_cache(self):
+        self.assertAuthenticated()
+        self.manager.set_password('secret-password')
+        self.manager.save()
+        self.assertAuthenticated()
+        response = self.client.post('/token/login/', {'username': 'manager1', 'password': 'secret-password'})
+        self.assertEqual(response.json()['auth_token'], self.token.key)
+        with self.assertNumQueries(0):
+            get_token(self.token.key)
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token nope')
+        self.assertAuthenticated(False)
+        self.assertIsNone(caches[SHARED_CACHE].get('littlelemon:token:nope'))
+
+
+class CatalogCacheTests(LittleLemonTestCase):
+    def test_repeated_reads_skip_the_database(self):
+        first = self.request('get', '/api/menu-items?ordering=-price&page=2', self.customer)
+        with self.assertNumQueries(0):
+            second = self.request('get', '/api/menu-items?page=2&ordering=-price', self.customer)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_query_params_are_part_of_the_key(self):
+        first = self.request('get', '/api/menu-items?page=1', self.customer)
+        second = self.request('get', '/api/menu-items?page=2', self.customer)
+        self.assertNotEqual(first.data, second.data)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_manager_writes_invalidate(self):
+        before = self.request('get', '/api/categories', self.customer)
+        response = self.request('patch', f'/api/categories/{self.categories[0].id}',
+                                self.manager, {'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+
+        after = self.request('get', '/api/categories', self.customer)
+        self.assertNotEqual(before['ETag'], after['ETag'])
+        self.assertEqual(after.data['results'][0]['title'], 'Renamed')
+
+    def test_conditional_get(self):
+        response = self.request('get', f'/api/menu-items/{self.menuitems[0].id}', self.customer)
+        self.client.credentials(HTTP_IF_NONE_MATCH=response['ETag'])
+        with self.assertNumQueries(0):
+            response = self.request('get', f'/api/menu-items/{self.menuitems[0].id}', self.customer)
+        self.assertEqual(response.status_code, 304)
+
+        # Once the second of the last write is over
+        later = time.time() + 1
+        with mock.patch('LittleLemonAPI.caching.time.time', return_value=later):
+            response = self.request('get', f'/api/menu-items/{self.menuitems[0].id}', self.customer)
+            self.client.credentials(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            response = self.request('get', f'/api/menu-items/{self.menuitems[0].id}', self.customer)
+        self.assertEqual(response.status_code, 304)
+
+    def test_no_last_modified_within_the_second_of_a_write(self):
+        # Another write in the same second would have the same date
+        with mock.patch('LittleLemonAPI.caching.time.time', return_value=2_000_000_000.5):
+            self.request('patch', f'/api/categories/{self.categories[0].id}', self.manager, {'title': 'Renamed'})
+            response = self.request('get', '/api/categories', self.customer)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_version_is_shared_and_increases_on_writes(self):
+        self.request('get', '/api/categories', self.customer)
+        before = caches[SHARED_CACHE].get('littlelemon:catalog:version')
+        self.request('patch', f'/api/categories/{self.categories[0].id}', self.manager, {'title': 'Renamed'})
+        self.request('patch', f'/api/categories/{self.categories[0].id}', self.manager, {'title': 'Again'})
+        self.assertGreaterEqual(caches[SHARED_CACHE].get('littlelemon:catalog:version'), before + 2)
+
+
+class CatalogQueryTests(LittleLemonTestCase):
+    def test_menu_items_load_categories_in_the_same_query(self):
+        with self.assertNumQueries(2):
+            response = self.request('get', '/api/menu-items', self.customer)
+        self.assertEqual(response.data['results'][0]['category']['slug'], 'cat-0')
+
+    def test_cart_loads_menu_items_and_categories_in_one_query(self):
+        self.fill_cart(self.customer)
+        with self.assertNumQueries(1):
+            response = self.request('get', '/api/cart/menu-items', self.customer)
+        self.assertEqual(len(response.data), len(self.menuitems))
+        self.assertIn('category', response.data[0]['menuitem'])
+
+
+class MenuSearchTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mains = Category.objects.create(slug="main-courses", title="Mains")
+        self.chicken = MenuItem.objects.create(title="Chicken salad", price=Decimal("8.00"), featured=False,
+                                               category=self.categories[0])
+        self.curry = MenuItem.objects.create(title="Chickpea curry", price=Decimal("9.00"), featured=False,
+                                             category=self.mains)
+
+    def search(self, query, backend=None):
+        # Model writes don't bump the catalog version, only the views do
+        cache.clear()
+        with mock.patch('LittleLemonAPI.search.get_backend', return_value=backend or FTS5Backend()):
+            response = self.request('get', f'/api/menu-items?page_size=10&search={query}', self.customer)
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.data['results']]
+
+    def test_prefix_and_relevance(self):
+        self.assertCountEqual(self.search('chick'), ["Chicken salad", "Chickpea curry"])
+        self.assertEqual(self.search('CHICKEN'), ["Chicken salad"])
+        # Every term has to match, in any indexed field
+        self.assertEqual(self.search('chick main'), ["Chickpea curry"])
+        self.assertEqual(self.search('course'), ["Chickpea curry"])
+        self.assertEqual(self.search('nothing'), [])
+        self.assertEqual(self.search('"*'), [item.title for item in self.menuitems] + ["Chicken salad", "Chickpea curry"])
+
+        # A title match ranks above a category match
+        MenuItem.objects.create(title="Main special", price=Decimal("7.00"), featured=False, category=self.categories[1])
+        self.assertEqual(self.search('main'), ["Main special", "Chickpea curry"])
+
+    def test_ordering_overrides_relevance(self):
+        response = self.request('get', '/api/menu-items?search=chick&ordering=-price', self.customer)
+        self.assertEqual([item['title'] for item in response.data['results']], ["Chickpea curry", "Chicken salad"])
+        response = self.request('get', '/api/menu-items?search=chick&cursor=', self.customer)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_index_follows_writes(self):
+        self.chicken.title = "Caesar salad"
+        self.chicken.save()
+        self.assertEqual(self.search('chick'), ["Chickpea curry"])
+        self.mains.title = "Vegetarian"
+        self.mains.save()
+        self.assertEqual(self.search('vegetarian'), ["Chickpea curry"])
+        self.request('delete', f'/api/menu-items/{self.curry.id}', self.manager)
+        self.assertEqual(self.search('vegetarian'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {FTS5Backend.table} WHERE rowid = %s', [self.curry.id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_bulk_writes_update_the_index(self):
+        changes = [
+            {'op': 'create', 'title': 'Lemon tart', 'price': '4.00', 'featured': False, 'category_id': self.mains.id},
+            {'op': 'update', 'id': self.chicken.id, 'title': 'Lemon chicken'},
+            {'op': 'delete', 'id': self.curry.id},
+        ]
+        response = self.request('post', '/api/menu-items/bulk', self.manager, changes)
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual(self.search('lemon'), ["Lemon chicken", "Lemon tart"])
+        self.assertEqual(self.search('chickpea'), [])
+
+    def test_like_backend(self):
+        self.assertEqual(self.search('chick', LikeBackend()), ["Chicken salad", "Chickpea curry"])
+        self.assertEqual(self.search('mains', LikeBackend()), ["Chickpea curry"])
+
+    def test_index_command(self):
+        out = io.StringIO()
+        call_command('search_index', '--drop', stdout=out)
+        with self.assertRaises(OperationalError):
+            self.search('chick')
+        call_command('search_index', stdout=out)
+        self.assertCountEqual(self.search('chick'), ["Chicken salad", "Chickpea curry"])
+        # Safe to run again
+        call_command('search_index', stdout=out)
+        self.assertCountEqual(self.search('chick'), ["Chicken salad", "Chickpea curry"])
+
+    def test_every_match_is_returned(self):
+        MenuItem.objects.bulk_create([
+            MenuItem(title=f'Chicken {i}', price=1, featured=False, category=self.categories[0]) for i in range(600)
+        ])
+        FTS5Backend().rebuild()
+        self.assertEqual(FTS5Backend().search(MenuItem.objects.all(), ['chick']).count(), 602)
+
+    def test_falls_back_to_like_on_other_databases(self):
+        get_backend.cache_clear()
+        self.addCleanup(get_backend.cache_clear)
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            self.assertIsInstance(get_backend(), LikeBackend)
+
+    def test_async_view_searches_too(self):
+        token = Token.objects.create(user=self.customer)
+        response = self.client.get('/api/async/menu-items?search=chick',
+                                   headers={'Authorization': f'Token {token.key}'})
+        self.assertCountEqual([item['title'] for item in response.json()['results']], ["Chicken salad", "Chickpea curry"])
+
+
+class PaginationTests(LittleLemonTestCase):
+    def walk(self, url, user):
+        seen = []
+        while url:
+            response = self.request('get', url, user)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return seen
+
+    def test_order_cursor_walks_newest_first(self):
+        orders = [self.create_order(self.customer) for _ in range(5)]
+        Order.objects.filter(id=orders[0].id).update(date=datetime.date.today() + datetime.timedelta(days=1))
+
+        seen = self.walk('/api/orders?cursor=&page_size=2', self.manager)
+        expected = [orders[0].id] + [order.id for order in reversed(orders[1:])]
+        self.assertEqual(seen, expected)
+
+    def test_menu_item_cursor_follows_ordering_filter(self):
+        MenuItem.objects.filter(id=self.menuitems[3].id).update(price=self.menuitems[0].price)
+        seen = self.walk('/api/menu-items?ordering=-price&cursor=', self.customer)
+        expected = list(MenuItem.objects.order_by('-price', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_previous_link(self):
+        for _ in range(5):
+            self.create_order(self.customer)
+        first = self.request('get', '/api/orders?cursor=&page_size=2', self.manager)
+        second = self.request('get', first.data['next'], self.manager)
+        back = self.request('get', second.data['previous'], self.manager)
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_deep_cursor_pages_cost_the_same(self):
+        for _ in range(6):
+            self.create_order(self.customer)
+        url = '/api/orders?cursor=&page_size=2'
+        self.request('get', url, self.manager)
+        with self.assertNumQueries(2):
+            response = self.request('get', url, self.manager)
+        with self.assertNumQueries(2):
+            response = self.request('get', response.data['next'], self.manager)
+        with self.assertNumQueries(2):
+            self.request('get', response.data['next'], self.manager)
+
+    def test_invalid_cursor(self):
+        response = self.request('get', '/api/orders?cursor=garbage', self.manager)
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_without_count(self):
+        with self.assertNumQueries(1):
+            response = self.request('get', '/api/categories?count=false&page_size=1', self.customer)
+        self.assertNotIn('count', response.data)
+        self.assertIsNotNone(response.data['next'])
+        response = self.request('get', response.data['next'], self.customer)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+
+class CartUpsertTests(LittleLemonTestCase):
+    def add(self, menuitem, quantity):
+        return self.request('post', '/api/cart/menu-items', self.customer,
+                            {'menuitem': menuitem.id, 'quantity': quantity})
+
+    def test_add_then_increment(self):
+        item = self.menuitems[1]
+        self.assertEqual(self.add(item, 2).status_code, 201)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.add(item, 3).status_code, 202)
+
+        line = CartItem.objects.get(user=self.customer, menuitem=item)
+        self.assertEqual(line.quantity, 5)
+        self.assertEqual(line.price, item.price * 5)
+
+    def test_unknown_menu_item(self):
+        response = self.request('post', '/api/cart/menu-items', self.customer, {'menuitem': 999})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_concurrent_insert_falls_back_to_increment(self):
+        item = self.menuitems[0]
+        self.fill_cart(self.customer, [item], quantity=1)
+
+        # Simulates another request creating the line between our UPDATE and INSERT
+        real_update = CartItemQuerySet.update
+        calls = []
+        def racing_update(queryset, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else real_update(queryset, **kwargs)
+
+        with mock.patch.object(CartItemQuerySet, 'update', racing_update):
+            created = CartItem.objects.add(self.customer.id, item.id, item.price, 2)
+        self.assertFalse(created)
+        self.assertEqual(CartItem.objects.get(user=self.customer, menuitem=item).quantity, 3)
+
+
+class CartBatchTests(LittleLemonTestCase):
+    url = '/api/cart/menu-items/batch'
+
+    def test_batch_creates_and_increments(self):
+        self.fill_cart(self.customer, self.menuitems[:1], quantity=1)
+        payload = [
+            {'menuitem': self.menuitems[0].id, 'quantity': 2},
+            {'menuitem': self.menuitems[1].id},
+            {'menuitem': self.menuitems[1].id, 'quantity': 3},
+            {'menuitem': 999},
+            {'quantity': 1},
+        ]
+        response = self.request('post', self.url, self.customer, payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [line['status'] for line in response.data],
+            ['updated', 'created', 'created', 'error', 'error']
+        )
+
+        lines = {line.menuitem_id: line for line in CartItem.objects.filter(user=self.customer)}
+        self.assertEqual(lines[self.menuitems[0].id].quantity, 3)
+        self.assertEqual(lines[self.menuitems[0].id].price, self.menuitems[0].price * 3)
+        self.assertEqual(lines[self.menuitems[1].id].quantity, 4)
+
+    def test_query_count_is_independent_of_batch_size(self):
+        self.fill_cart(self.customer, self.menuitems[:2])
+        payload = [{'menuitem': item.id, 'quantity': 2} for item in self.menuitems]
+        # IN lookup, existing lines, UPDATE, INSERT and the savepoints around them
+        with CaptureQueriesContext(connection) as ctx:
+            self.request('post', self.url, self.customer, payload[:3])
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            self.request('post', self.url, self.customer, payload)
+
+    def test_rejects_non_list_payload(self):
+        response = self.request('post', self.url, self.customer, {'menuitem': self.menuitems[0].id})
+        self.assertEqual(response.status_code, 400)
+
+
+class IdempotencyTests(LittleLemonTestCase):
+    def post(self, url, data=None, key='retry-1', user=None):
+        self.client.force_authenticate(user or self.customer)
+        return self.client.post(url, data, format='json', headers={'Idempotency-Key': key})
+
+    def test_cart_retry_is_replayed(self):
+        line = {'menuitem': self.menuitems[0].id, 'quantity': 2}
+        first = self.post('/api/cart/menu-items', line)
+        retry = self.post('/api/cart/menu-items', line)
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(CartItem.objects.get(user=self.customer).quantity, 2)
+
+        # Another key, or another user with the same key, is a new request
+        self.assertEqual(self.post('/api/cart/menu-items', line, key='retry-2').status_code, 202)
+        self.assertEqual(self.post('/api/cart/menu-items', line, user=self.manager).status_code, 201)
+        self.assertEqual(CartItem.objects.get(user=self.customer).quantity, 4)
+
+    def test_checkout_retry_creates_one_order(self):
+        self.fill_cart(self.customer)
+        self.assertEqual(self.post('/api/orders').status_code, 201)
+        self.fill_cart(self.customer)
+        # Only the stored result is read, from the cache database; checkout doesn't run again
+        with self.assertNumQueries(0):
+            retry = self.post('/api/orders')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(Order.objects.filter(user=self.customer).count(), 1)
+        self.assertEqual(CartItem.objects.filter(user=self.customer).count(), len(self.menuitems))
+
+    def test_key_reused_for_another_request(self):
+        self.post('/api/cart/menu-items', {'menuitem': self.menuitems[0].id})
+        response = self.post('/api/cart/menu-items', {'menuitem': self.menuitems[1].id})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.post('/api/cart/menu-items', key='x' * 256).status_code, 400)
+
+    def test_server_errors_are_not_stored(self):
+        line = {'menuitem': self.menuitems[0].id}
+        with mock.patch.object(CartItem.objects, 'add', side_effect=OperationalError), \
+                self.assertRaises(OperationalError):
+            self.post('/api/cart/menu-items', line)
+        self.assertEqual(self.post('/api/cart/menu-items', line).status_code, 201)
+
+    def test_concurrent_duplicate(self):
+        line = {'menuitem': self.menuitems[0].id}
+        result_key = idempotency._cache_key(SimpleNamespace(user=self.customer), 'retry-1')
+        lock_key = f'{result_key}:lock'
+        idempotency.cache.add(lock_key, 'first', idempotency.LOCK_TIMEOUT)
+
+        with mock.patch.object(idempotency, 'WAIT', 0.01):
+            response = self.post('/api/cart/menu-items', line)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(CartItem.objects.exists())
+
+        # The first request finishes while the duplicate waits
+        request = SimpleNamespace(method='POST', path='/api/cart/menu-items', data=line)
+        def first_finishes(seconds):
+            stored = {'fingerprint': idempotency._fingerprint(request), 'status': 201, 'data': {'details': 'ok'}}
+            idempotency.cache.set(result_key, stored)
+            idempotency.cache.delete(lock_key)
+        with mock.patch.object(idempotency.time, 'sleep', side_effect=first_finishes):
+            response = self.post('/api/cart/menu-items', line)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertFalse(CartItem.objects.exists())
+
+
+class MenuItemBulkTests(LittleLemonTestCase):
+    url = '/api/menu-items/bulk'
+
+    def test_mixed_changes_with_row_errors(self):
+        rows = [
+            {'op': 'create', 'title': 'New', 'price': '4.00', 'featured': True, 'category_id': self.categories[1].id},
+            {'op': 'update', 'id': self.menuitems[0].id, 'price': '9.99'},
+            {'op': 'update', 'id': self.menuitems[1].id, 'title': 'Renamed', 'category_id': self.categories[0].id},
+            {'op': 'delete', 'id': self.menuitems[2].id},
+            {'op': 'create', 'title': 'Orphan', 'price': '1.00', 'featured': False, 'category_id': 999},
+            {'op': 'update', 'id': 999, 'price': '1.00'},
+            {'op': 'update', 'id': self.menuitems[0].id, 'price': '1.00'},
+            {'op': 'update', 'id': self.menuitems[3].id, 'price': 'free'},
+            {'op': 'rename'},
+        ]
+        response = self.request('post', self.url, self.manager, rows)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created', 'updated', 'updated', 'deleted', 'error', 'error', 'error', 'error', 'error']
+        )
+        self.assertEqual(results[4]['details'], 'Category ID <999> not found')
+        self.assertEqual(results[5]['details'], 'MenuItem not found')
+        self.assertIn('price', results[7]['details'])
+
+        created = MenuItem.objects.get(id=results[0]['id'])
+        self.assertEqual((created.title, created.category_id), ('New', self.categories[1].id))
+        self.assertEqual(MenuItem.objects.get(id=self.menuitems[0].id).price, Decimal('9.99'))
+        self.assertEqual(MenuItem.objects.get(id=self.menuitems[1].id).title, 'Renamed')
+        self.assertFalse(MenuItem.objects.filter(id=self.menuitems[2].id).exists())
+
+    def test_query_count_is_independent_of_batch_size(self):
+        def reprice(count):
+            MenuItem.objects.bulk_create([
+                MenuItem(title=f'Bulk {i}', price=1, featured=False, category=self.categories[0])
+                for i in range(count)
+            ])
+            rows = [
+                {'op': 'update', 'id': menuitem.id, 'price': '2.00'}
+                for menuitem in MenuItem.objects.filter(title__startswith='Bulk')
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.request('post', self.url, self.manager, rows)
+            MenuItem.objects.filter(title__startswith='Bulk').delete()
+            return len(queries)
+
+        get_roles(self.manager)
+        self.assertEqual(reprice(5), reprice(50))
+
+    def test_delete_query_count_is_independent_of_batch_size(self):
+        def delete(count):
+            created = MenuItem.objects.bulk_create([
+                MenuItem(title=f'Bulk {i}', price=1, featured=False, category=self.categories[0])
+                for i in range(count)
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                self.request('post', self.url, self.manager, [{'op': 'delete', 'id': menuitem.id} for menuitem in created])
+            return len(queries)
+
+        get_roles(self.manager)
+        self.assertEqual(delete(5), delete(50))
+
+    def test_updates_only_write_the_fields_they_send(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.request('post', self.url, self.manager, [
+                {'op': 'update', 'id': self.menuitems[0].id, 'title': 'Renamed'},
+                {'op': 'update', 'id': self.menuitems[1].id, 'price': '3.00'},
+            ])
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "LittleLemonAPI_menuitem"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(sorted('"price"' in sql for sql in updates), [False, True])
+        self.assertEqual(sorted('"title"' in sql for sql in updates), [False, True])
+
+    def test_invalidates_catalog_cache_once(self):
+        self.request('get', '/api/menu-items', self.customer)
+        with mock.patch('LittleLemonAPI.views.bump_catalog_version') as bump:
+            self.request('post', self.url, self.manager, [
+                {'op': 'update', 'id': menuitem.id, 'featured': True} for menuitem in self.menuitems
+            ])
+        bump.assert_called_once_with()
+
+    def test_rejected_requests(self):
+        self.assertEqual(self.request('post', self.url, self.customer, []).status_code, 403)
+        self.assertEqual(self.request('post', self.url, self.manager, {'op': 'delete'}).status_code, 400)
+        response = self.request('post', self.url, self.manager, [{'op': 'delete', 'id': 999}])
+        self.assertEqual(response.status_code, 400)
+
+
+class DispatchTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        crew_group = Group.objects.get(name=DELIVERY_CREW)
+        self.crew2 = User.objects.create_user(username="delivery2")
+        self.crew2.groups.add(crew_group)
+        self.busy = [self.create_order(self.customer, crew=self.crew) for _ in range(2)]
+        self.delivered = self.create_order(self.customer, crew=self.crew2)
+        self.delivered.status = True
+        self.delivered.save()
+        self.pending = [self.create_order(self.customer) for _ in range(3)]
+
+    def test_queue_and_crew_load(self):
+        response = self.request('get', '/api/dispatch?page_size=10&fields=id,delivery_crew&expand=', self.manager)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([order['id'] for order in data['results']], [order.id for order in self.busy + self.pending])
+        self.assertEqual(data['unassigned'], 3)
+        self.assertEqual(
+            [(crew['username'], crew['pending']) for crew in data['crew']],
+            [('delivery2', 0), ('delivery1', 2)]
+        )
+
+        response = self.request('get', '/api/dispatch?unassigned=true&page_size=10', self.manager)
+        self.assertEqual(len(response.json()['results']), 3)
+        response = self.request('get', f'/api/dispatch?crew={self.crew.id}', self.manager)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_bulk_assignment(self):
+        rows = [
+            {'order': self.pending[0].id, 'delivery_crew': self.crew2.id},
+            {'order': self.pending[1].id, 'delivery_crew': self.crew.id},
+            {'order': self.pending[2].id, 'delivery_crew': self.customer.id},
+            {'order': self.delivered.id, 'delivery_crew': self.crew.id},
+            {'order': 999, 'delivery_crew': self.crew.id},
+            {'order': self.pending[0].id},
+        ]
+        get_roles(self.manager)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request('post', '/api/dispatch', self.manager, rows)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()],
+            ['assigned', 'assigned', 'error', 'error', 'error', 'error']
+        )
+        # Order lookup, crew check, the orders' previous crew, one UPDATE and one event INSERT
+        self.assertEqual(len([query for query in queries if 'SAVEPOINT' not in query['sql']]), 5)
+        self.assertEqual(Order.objects.get(id=self.pending[0].id).delivery_crew, self.crew2)
+        self.assertEqual(Order.objects.get(id=self.pending[1].id).delivery_crew, self.crew)
+        self.assertIsNone(Order.objects.get(id=self.pending[2].id).delivery_crew)
+
+    def test_balance_by_load(self):
+        response = self.request('post', '/api/dispatch/balance', self.manager)
+        self.assertEqual(response.status_code, 200)
+        assigned = {row['order']: row['delivery_crew'] for row in response.json()}
+        # delivery2 starts idle and takes the two oldest, then both have two
+        self.assertEqual(assigned, {
+            self.pending[0].id: self.crew2.id,
+            self.pending[1].id: self.crew2.id,
+            self.pending[2].id: self.crew.id,
+        })
+        self.assertEqual(self.request('post', '/api/dispatch/balance', self.manager).json(), [])
+
+    def test_balance_selected_orders(self):
+        response = self.request('post', '/api/dispatch/balance', self.manager, {'orders': [self.pending[2].id]})
+        self.assertEqual(response.json(), [{'order': self.pending[2].id, 'delivery_crew': self.crew2.id}])
+
+    def test_balance_rejects_anything_but_a_list_of_ids(self):
+        for orders in ("12", 12, ["1", "2"], [1, "x"], [{"id": 1}], [True], {"id": 1}):
+            with self.subTest(orders=orders):
+                response = self.request('post', '/api/dispatch/balance', self.manager, {'orders': orders})
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.filter(id__in=[order.id for order in self.pending], delivery_crew__isnull=False).exists())
+
+    def test_manager_only(self):
+        self.assertEqual(self.request('get', '/api/dispatch', self.crew).status_code, 403)
+        self.assertEqual(self.request('post', '/api/dispatch/balance', self.crew).status_code, 403)
+
+
+class GroupMembershipTests(LittleLemonTestCase):
+    url = '/api/groups/delivery-crew/users'
+
+    def setUp(self):
+        super().setUp()
+        self.drivers = [User.objects.create_user(username=f"driver{i}") for i in range(5)]
+
+    def test_bulk_add_and_remove(self):
+        data = {
+            'add': [driver.username for driver in self.drivers] + ['nobody', self.drivers[0].username],
+            'remove': [self.crew.username],
+        }
+        get_roles(self.manager)
+        get_roles(self.crew)
+        # Group cache warm-up
+        self.request('get', self.url, self.manager)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request('post', f'{self.url}/bulk', self.manager, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()],
+            ['added'] * 5 + ['error', 'error', 'removed']
+        )
+        # Username lookup, one INSERT and one DELETE, inside a transaction
+        self.assertEqual(len([query for query in queries if 'SAVEPOINT' not in query['sql']]), 3)
+
+        crew = set(Group.objects.get(name=DELIVERY_CREW).user_set.all())
+        self.assertEqual(crew, set(self.drivers))
+        # Cached roles are dropped even though no m2m signal is sent
+        self.assertEqual(get_roles(self.drivers[0]), {DELIVERY_CREW})
+        self.assertEqual(get_roles(self.crew), frozenset())
+
+    def test_adding_existing_members(self):
+        response = self.request('post', f'{self.url}/bulk', self.manager, {'add': [self.crew.username]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Group.objects.get(name=DELIVERY_CREW).user_set.count(), 1)
+
+    def test_invalid_requests(self):
+        for data in ({}, [], {'add': 'driver0'}, {'add': ['nobody']}):
+            response = self.request('post', f'{self.url}/bulk', self.manager, data)
+            self.assertEqual(response.status_code, 400, data)
+        response = self.request('post', f'{self.url}/bulk', self.customer, {'add': ['driver0']})
+        self.assertEqual(response.status_code, 403)
+
+    def test_paginated_listing(self):
+        Group.objects.get(name=DELIVERY_CREW).user_set.add(*self.drivers)
+        response = self.request('get', f'{self.url}?page_size=4', self.manager)
+        data = response.json()
+        self.assertEqual(data['count'], 6)
+        self.assertEqual(data['results'][0], {'id': self.crew.id, 'email': '', 'username': 'delivery1'})
+        self.assertEqual(len(data['results']), 4)
+
+    def test_group_lookup_is_cached(self):
+        get_roles(self.manager)
+        self.request('get', self.url, self.manager)
+        with CaptureQueriesContext(connection) as queries:
+            self.request('get', self.url, self.manager)
+        self.assertFalse([query for query in queries if '"auth_group"' in query['sql']])
+
+        Group.objects.filter(name=DELIVERY_CREW).delete()
+        with self.assertRaises(Group.DoesNotExist):
+            get_group(DELIVERY_CREW)
+
+
+class SalesReportTests(LittleLemonTestCase):
+    url = '/api/reports/sales'
+
+    def checkout(self, user, items, quantity):
+        self.fill_cart(user, items, quantity=quantity)
+        self.assertEqual(self.request('post', '/api/orders', user).status_code, 201)
+
+    def test_checkout_and_delete_maintain_totals(self):
+        self.checkout(self.customer, self.menuitems[:2], quantity=2)
+        self.checkout(self.crew, self.menuitems[1:3], quantity=1)
+
+        by_item = {row['menuitem']: row for row in self.request('get', f'{self.url}?group_by=menuitem', self.manager).data}
+        self.assertEqual(by_item[self.menuitems[1].id]['quantity'], 3)
+        self.assertEqual(by_item[self.menuitems[1].id]['revenue'], self.menuitems[1].price * 3)
+
+        day = self.request('get', self.url, self.manager).data
+        self.assertEqual(day[0]['revenue'], sum(Order.objects.values_list('total', flat=True)))
+
+        order = Order.objects.get(user=self.crew)
+        self.request('delete', f'/api/orders/{order.id}', self.manager)
+        day = self.request('get', self.url, self.manager).data
+        self.assertEqual(day[0]['revenue'], Order.objects.get().total)
+
+    def test_reports_do_not_scan_order_items(self):
+        self.checkout(self.customer, self.menuitems, quantity=1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.request('get', f'{self.url}?group_by=category', self.manager)
+        self.assertFalse(any('orderitem' in query['sql'].lower() for query in ctx.captured_queries))
+
+    def test_filters(self):
+        self.checkout(self.customer, self.menuitems, quantity=1)
+        category = self.categories[0]
+        today = datetime.date.today()
+
+        rows = self.request('get', f'{self.url}?group_by=category&category={category.id}', self.manager).data
+        self.assertEqual([row['category'] for row in rows], [category.id])
+        rows = self.request('get', f'{self.url}?start={today + datetime.timedelta(days=1)}', self.manager).data
+        self.assertEqual(list(rows), [])
+        self.assertEqual(self.request('get', f'{self.url}?end=yesterday', self.manager).status_code, 400)
+
+    def test_manager_only(self):
+        self.assertEqual(self.request('get', self.url, self.customer).status_code, 403)
+
+
+class OrderExportTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = [
+            self.create_order(self.customer, crew=self.crew),
+            self.create_order(self.customer, items=self.menuitems[:1]),
+        ]
+        Order.objects.filter(id=self.orders[0].id).update(date=datetime.date(2024, 1, 31))
+        OrderItem.objects.filter(order=self.orders[1]).delete()
+
+    def export(self, query='', **headers):
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(f'/api/orders/export{query}', headers=headers)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        orders = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([order['order_id'] for order in orders], [order.id for order in self.orders])
+        self.assertEqual(orders[0]['date'], '2024-01-31')
+        self.assertEqual(orders[0]['delivery_crew_id'], self.crew.id)
+        self.assertEqual(len(orders[0]['orderitems']), 4)
+        self.assertEqual(orders[0]['orderitems'][0]['unit_price'], '2.50')
+        # Orders without items are still exported
+        self.assertEqual(orders[1]['orderitems'], [])
+
+    def test_csv_and_date_range(self):
+        response, body = self.export('?format=csv&end=2024-12-31')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="orders-2024-12-31.csv"')
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['order_id'] for row in rows}, {str(self.orders[0].id)})
+        self.assertEqual(rows[0]['menuitem_title'], 'Item 0')
+
+        _, body = self.export('', **{'Accept': 'text/csv'})
+        self.assertEqual(len(body.splitlines()), 6)
+
+    def test_manager_only(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/orders/export').status_code, 403)
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/api/orders/export?start=yesterday')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid start date', json.loads(response.content)['details'])
+
+
+class QueryPlanTests(LittleLemonTestCase):
+    '''
+    Runs EXPLAIN QUERY PLAN on every filtered or paged statement an endpoint
+    issues. Filtered ones fail on a plain `SCAN <table>` (`SCAN TABLE <table>`
+    before SQLite 3.36), i.e. a full table scan without an index. Unfiltered
+    pages may walk a table in index order and stop at the LIMIT, but fail when
+    they have to sort the whole table first.
+    '''
+    full_scan = re.compile(r'\bSCAN (?:TABLE )?(\S+)(?: AS \S+)?$')
+    full_sort = 'USE TEMP B-TREE FOR ORDER BY'
+
+    def setUp(self):
+        super().setUp()
+        for _ in range(3):
+            self.create_order(self.customer, crew=self.crew, items=self.menuitems[:2])
+        self.fill_cart(self.customer, self.menuitems[2:])
+
+    def assert_indexed(self, method, url, user, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.request(method, url, user, data)
+        self.assertLess(response.status_code, 400)
+
+        statements = [
+            query['sql'] for query in ctx.captured_queries
+            if query['sql'].startswith(('SELECT', 'UPDATE', 'DELETE'))
+            and (' WHERE ' in query['sql'] or ' LIMIT ' in query['sql'])
+        ]
+        self.assertTrue(statements, f'{method.upper()} {url} issued no filtered or paged query')
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+                self.assertTrue(plan, f'No query plan for: {sql}')
+                for detail in plan:
+                    if ' WHERE ' in sql:
+                        self.assertIsNone(self.full_scan.search(detail), f'{detail}\n  in: {sql}')
+                    else:
+                        self.assertNotIn(self.full_sort, detail, f'{detail}\n  in: {sql}')
+
+    def test_plan_formats(self):
+        for detail in ('SCAN LittleLemonAPI_order', 'SCAN TABLE LittleLemonAPI_order', 'SCAN TABLE LittleLemonAPI_order AS o'):
+            self.assertEqual(self.full_scan.search(detail).group(1), 'LittleLemonAPI_order')
+        for detail in ('SCAN LittleLemonAPI_order USING INDEX order_user_idx',
+                       'SCAN TABLE LittleLemonAPI_order USING COVERING INDEX order_user_idx',
+                       'SEARCH LittleLemonAPI_order USING INTEGER PRIMARY KEY (rowid=?)',
+                       'SCAN CONSTANT ROW'):
+            self.assertIsNone(self.full_scan.search(detail), detail)
+
+    def test_order_listings(self):
+        self.assert_indexed('get', '/api/orders', self.customer)
+        self.assert_indexed('get', '/api/orders', self.crew)
+        self.assert_indexed('get', '/api/orders', self.manager)
+        self.assert_indexed('get', '/api/orders?cursor=&page_size=1', self.manager)
+
+    def test_order_detail(self):
+        self.assert_indexed('get', f'/api/orders/{Order.objects.first().id}', self.customer)
+
+    def test_cart(self):
+        self.assert_indexed('get', '/api/cart/menu-items', self.customer)
+        self.assert_indexed('post', '/api/cart/menu-items', self.customer, {'menuitem': self.menuitems[2].id})
+
+    def test_checkout(self):
+        self.assert_indexed('post', '/api/orders', self.customer)
+
+    def test_menu_item_keyset(self):
+        first = self.request('get', '/api/menu-items?ordering=price&cursor=&page_size=1', self.customer)
+        self.assert_indexed('get', first.data['next'], self.customer)
+
+    def test_sales_report(self):
+        self.assert_indexed('get', f'/api/reports/sales?start={datetime.date.today()}', self.manager)
+
+
+class EndpointBenchmarkTests(APITestCase):
+    databases = {'default', 'cache'}
+
+    def test_every_route_is_benchmarked(self):
+        routes = {str(pattern.pattern) for pattern in urls.urlpatterns}
+        self.assertEqual(routes - {endpoint.route for endpoint in ENDPOINTS}, set())
+
+    def test_suite_runs_at_small_scale(self):
+        cache.clear()
+        users = seed(categories=2, menuitems=10, customers=2, delivery_crew=2, orders=10)
+        results = run_endpoint_benchmarks(users, repeat=2)
+        failures = {key: result['status'] for key, result in results.items() if result['status'] >= 400}
+        self.assertEqual(failures, {})
+
+    def test_compare(self):
+        baseline = {'GET /api/orders [manager]': {
+            'status': 200, 'queries': 3, 'p50_ms': 10, 'p99_ms': 20, 'alloc_kib': 100
+        }}
+        same = {'GET /api/orders [manager]': dict(baseline['GET /api/orders [manager]'], p50_ms=15)}
+        self.assertEqual(compare(same, baseline), [])
+
+        # A p99 spike on its own is noise
+        spike = {'GET /api/orders [manager]': dict(baseline['GET /api/orders [manager]'], p99_ms=100)}
+        self.assertEqual(compare(spike, baseline), [])
+
+        worse = {'GET /api/orders [manager]': dict(baseline['GET /api/orders [manager]'], queries=4, p50_ms=25, alloc_kib=200)}
+        self.assertEqual(len(compare(worse, baseline)), 3)
+
+
+class RequestMetricsTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_server_timing_breakdown(self):
+        self.create_order(self.customer)
+        response = self.request('get', '/api/orders', self.customer)
+        timing = dict(
+            entry.split(';')[0:2] for entry in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(set(timing), {'db', 'serialize', 'render', 'throttle', 'total'})
+        self.assertIn('queries"', response['Server-Timing'])
+
+    @override_settings(LITTLELEMON_METRICS={'TOKEN': 's3cret'})
+    def test_prometheus_export(self):
+        self.request('get', '/api/orders', self.customer)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('littlelemon_requests_total{view="OrderView",method="GET",status="200"} 1', body)
+        self.assertIn('littlelemon_phase_seconds_total{view="OrderView",phase="serialize"}', body)
+        self.assertRegex(body, r'littlelemon_db_queries_total\{view="OrderView"\} [1-9]')
+
+    async def test_queries_are_counted_under_asgi(self):
+        token = await Token.objects.acreate(user=self.customer)
+        # The sync view runs in a worker thread, the async one on the event loop
+        for url in ('/api/orders', '/api/async/orders'):
+            response = await self.async_client.get(url, headers={'Authorization': f'Token {token.key}'})
+            self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    @override_settings(LITTLELEMON_METRICS={'TOKEN': 's3cret'})
+    def test_metrics_endpoint_needs_token_or_staff(self):
+        # Loopback is what every client looks like behind a local reverse proxy
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user(username="admin", is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_metrics_endpoint_without_token(self):
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer None'})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(LITTLELEMON_METRICS={'SAMPLE_RATE': 0})
+    def test_unsampled_requests_are_only_counted(self):
+        response = self.request('get', '/api/orders', self.customer)
+        self.assertNotIn('Server-Timing', response)
+        body = registry.export()
+        self.assertIn('littlelemon_requests_total{view="OrderView",method="GET",status="200"} 1', body)
+        self.assertNotIn('littlelemon_sampled_requests_total{view="OrderView"}', body)
+
+
+class DatabaseProfileTests(APITestCase):
+    databases = {'default', 'cache'}
+
+    def test_production_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = ConnectionHandler().configure_settings({'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(directory, 'db.sqlite3'),
+                **settings.DATABASE_PROFILES['production'],
+            }})['default']
+            wrapper = load_backend(config['ENGINE']).DatabaseWrapper(config, 'profile')
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {
+                        name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size')
+                    }
+                self.assertEqual(pragmas, {
+                    'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000, 'mmap_size': 128 * 1024 * 1024,
+                })
+                self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+            finally:
+                wrapper.close()
+        self.assertEqual(config['CONN_MAX_AGE'], 600)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+
+    def test_health(self):
+        self.client.force_login(User.objects.create_user(username="admin", is_staff=True))
+        response = self.client.get('/health')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['databases']['default']['status'], 'ok')
+        self.assertIn('journal_mode', data['databases']['default'])
+        self.assertEqual(data['caches'], {alias: {'status': 'ok'} for alias in settings.CACHES})
+
+    @override_settings(LITTLELEMON_METRICS={'TOKEN': 's3cret'})
+    def test_health_reports_failures(self):
+        with mock.patch.object(connection, 'cursor', side_effect=OperationalError('unable to open database file')):
+            response = self.client.get('/health', headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(
+            response.json()['databases']['default'],
+            {'status': 'error', 'details': 'unable to open database file'}
+        )
+
+    def test_health_details_are_staff_only(self):
+        with mock.patch.object(connection, 'cursor', side_effect=OperationalError('unable to open database file')):
+            response = self.client.get('/health', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['databases'], {'default': {'status': 'error'}, 'cache': {'status': 'ok'}})
+
+        self.client.force_login(User.objects.create_user(username="admin", is_staff=True))
+        response = self.client.get('/health', REMOTE_ADDR='10.0.0.7')
+        self.assertIn('journal_mode', response.json()['databases']['default'])
+
+
+class FieldSelectionTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_order(self.customer, crew=self.crew)
+
+    def get(self, url, user):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request('get', url, user)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in queries]
+
+    def test_slim_order_list_skips_relations(self):
+        self.get('/api/orders', self.customer)  # caches the roles
+        _, full_queries = self.get('/api/orders', self.customer)
+        slim, slim_queries = self.get('/api/orders?fields=id,status,total&expand=', self.customer)
+        self.assertEqual(slim['results'], [{'id': self.order.id, 'status': False, 'total': '16.00'}])
+        self.assertEqual(len(slim_queries), len(full_queries) - 1)
+        self.assertNotIn('JOIN', slim_queries[-1])
+
+    def test_collapsed_relations_render_ids(self):
+        data, queries = self.get(f'/api/orders/{self.order.id}?expand=orderitems.menuitem', self.manager)
+        self.assertEqual((data['user'], data['delivery_crew']), (self.customer.id, self.crew.id))
+        menuitem = data['orderitems'][0]['menuitem']
+        self.assertEqual(menuitem['category'], self.menuitems[0].category_id)
+        self.assertFalse(any('LittleLemonAPI_category' in sql for sql in queries))
+
+    def test_menu_items_and_cart(self):
+        data, queries = self.get(f'/api/menu-items/{self.menuitems[0].id}?fields=id,category&expand=', self.customer)
+        self.assertEqual(data, {'id': self.menuitems[0].id, 'category': self.categories[0].id})
+        self.assertNotIn('JOIN', queries[-1])
+
+        self.fill_cart(self.customer, self.menuitems[:1])
+        data, _ = self.get('/api/cart/menu-items?expand=menuitem', self.customer)
+        self.assertEqual(data[0]['menuitem']['category'], self.categories[0].id)
+        data, _ = self.get('/api/cart/menu-items?fields=menuitem,quantity&expand=', self.customer)
+        self.assertEqual(data, [{'menuitem': self.menuitems[0].id, 'quantity': 1}])
+
+    def test_writes_ignore_selection(self):
+        response = self.request('patch', f'/api/menu-items/{self.menuitems[0].id}?fields=id', self.manager,
+                                {'title': 'Renamed', 'category_id': self.categories[1].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'id': self.menuitems[0].id})
+        self.assertEqual(MenuItem.objects.get(id=self.menuitems[0].id).category, self.categories[1])
+
+
+class RenderingParityTests(LittleLemonTestCase):
+    options = [
+        (None, None),
+        (None, set()),
+        # `?fields=` with nothing selected
+        (set(), None),
+        ({'id', 'total', 'orderitems'}, {'orderitems.menuitem'}),
+        ({'id', 'user', 'menuitem', 'category'}, {'user', 'menuitem.category', 'category'}),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.create_order(self.customer, crew=self.crew)
+        self.create_order(self.customer, items=self.menuitems[:2])
+        self.fill_cart(self.customer, quantity=3)
+        MenuItem.objects.filter(id=self.menuitems[0].id).update(price=Decimal('0'))
+
+    def assert_parity(self, shape, serializer_class, queryset):
+        for fields, expand in self.options:
+            with self.subTest(model=queryset.model.__name__, fields=fields, expand=expand):
+                selected = shape.select(fields, expand)
+                expected = serializer_class(queryset, many=True, fields=fields, expand=expand).data
+                self.assertEqual(selected.render(selected.values(queryset)), expected)
+
+    def test_orders(self):
+        self.assert_parity(ORDER, OrderSerializer, Order.objects.order_by('id'))
+
+    def test_menu_items(self):
+        self.assert_parity(MENUITEM, MenuItemSerializer, MenuItem.objects.select_related('category'))
+
+    def test_cart(self):
+        self.assert_parity(CART, CartSerializer, CartItem.objects.select_related('menuitem__category').order_by('id'))
+
+    def test_order_detail_response(self):
+        order = Order.objects.get(user=self.customer, delivery_crew=None)
+        response = self.request('get', f'/api/orders/{order.id}', self.customer)
+        self.assertEqual(response.json(), json.loads(json.dumps(OrderSerializer(order).data)))
+
+
+class AsyncReadTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tokens = {
+            user.id: Token.objects.create(user=user).key
+            for user in (self.manager, self.crew, self.customer)
+        }
+
+    def aget(self, url, user=None, **headers):
+        if user is not None:
+            headers['Authorization'] = f'Token {self.tokens[user.id]}'
+        return self.async_client.get(url, headers=headers)
+
+    async def test_requires_credentials(self):
+        response = await self.aget('/api/async/menu-items')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = await self.aget('/api/async/menu-items', Authorization='Token nope')
+        self.assertEqual(response.status_code, 401)
+
+    def test_matches_sync_views(self):
+        order = self.create_order(self.customer, crew=self.crew)
+        self.fill_cart(self.customer)
+        paths = [
+            ('/api/menu-items?ordering=price&cursor=', self.customer),
+            (f'/api/categories/{self.categories[0].id}', self.customer),
+            ('/api/cart/menu-items', self.customer),
+            ('/api/orders', self.manager),
+            ('/api/orders', self.crew),
+            (f'/api/orders/{order.id}', self.customer),
+            ('/api/orders?fields=id,user,orderitems&expand=orderitems.menuitem', self.customer),
+            ('/api/cart/menu-items?expand=', self.customer),
+            ('/api/menu-items?fields=id,title', self.customer),
+        ]
+        for path, user in paths:
+            with self.subTest(path=path, user=user.username):
+                # Pagination links point back at the async route
+                expected = self.request('get', path, user).content.decode()
+                expected = json.loads(expected.replace('/api/', '/api/async/'))
+                self.client.force_authenticate(None)
+                headers = {'Authorization': f'Token {self.tokens[user.id]}'}
+                response = self.client.get(path.replace('/api/', '/api/async/'), headers=headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected)
+
+    def test_query_params_match_sync_views(self):
+        order = self.create_order(self.customer, crew=self.crew)
+        self.fill_cart(self.customer)
+        pks = {'categories': self.categories[0].id, 'menu-items': self.menuitems[0].id, 'orders': order.id}
+        routes = [
+            str(pattern.pattern).removeprefix('async/') for pattern in urls.urlpatterns
+            if str(pattern.pattern).startswith('async/')
+        ]
+        params = ['ordering=title', 'ordering=-id', 'ordering=-price', 'ordering=nope', 'search=item', 'search=1']
+        for route in routes:
+            resource = route.split('/')[0]
+            for param in params:
+                path = f"/api/{route.replace('<int:pk>', str(pks.get(resource)))}?{param}"
+                with self.subTest(path=path):
+                    cache.clear()
+                    expected = self.request('get', path, self.manager)
+                    self.assertEqual(expected.status_code, 200)
+                    # Pagination links point back at the async route
+                    expected = json.loads(expected.content.decode().replace('/api/', '/api/async/'))
+                    self.client.force_authenticate(None)
+                    headers = {'Authorization': f'Token {self.tokens[self.manager.id]}'}
+                    response = self.client.get(path.replace('/api/', '/api/async/'), headers=headers)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json(), expected)
+
+    def test_other_customers_order(self):
+        order = self.create_order(self.manager)
+        headers = {'Authorization': f'Token {self.tokens[self.customer.id]}'}
+        response = self.client.get(f'/api/async/orders/{order.id}', headers=headers)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/api/async/orders/0', headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_conditional_get(self):
+        response = await self.aget('/api/async/menu-items', self.customer)
+        self.assertEqual(response.status_code, 200)
+        response = await self.aget('/api/async/menu-items', self.customer, **{'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+class OrderEventTests(LittleLemonTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tokens = {
+            user.id: Token.objects.create(user=user).key
+            for user in (self.manager, self.crew, self.customer)
+        }
+        self.other = User.objects.create_user(username="customer2")
+        self.fill_cart(self.other)
+        self.request('post', '/api/orders', self.other)
+        self.fill_cart(self.customer)
+        self.request('post', '/api/orders', self.customer)
+        self.order = Order.objects.get(user=self.customer)
+        self.request('patch', f'/api/orders/{self.order.id}', self.manager, {'delivery_crew_id': self.crew.id})
+
+    def events(self):
+        return list(OrderEvent.objects.order_by('id').values_list(
+            'kind', 'order_id', 'delivery_crew_id', 'previous_delivery_crew_id', 'status'
+        ))
+
+    async def read(self, user, query='?last_event_id=0&timeout=0', **headers):
+        headers['Authorization'] = f'Token {self.tokens[user.id]}'
+        response = await self.async_client.get(f'/api/orders/events{query}', headers=headers)
+        if not response.streaming:
+            return response, []
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        return response, re.findall(r'^id: (\d+)\nevent: (\w+)\ndata: (.*)$', body, re.M)
+
+    def test_recorded_with_each_change(self):
+        other_order = Order.objects.get(user=self.other)
+        self.request('patch', f'/api/orders/{self.order.id}', self.crew, {'status': True})
+        self.request('post', '/api/dispatch', self.manager, [{'order': other_order.id, 'delivery_crew': self.crew.id}])
+        self.request('delete', f'/api/orders/{self.order.id}', self.manager)
+        self.assertEqual(self.events(), [
+            ('created', other_order.id, None, None, False),
+            ('created', self.order.id, None, None, False),
+            ('assigned', self.order.id, self.crew.id, None, False),
+            ('status', self.order.id, self.crew.id, None, True),
+            ('assigned', other_order.id, self.crew.id, None, False),
+            ('deleted', self.order.id, self.crew.id, None, True),
+        ])
+
+    def test_reassignment_reaches_the_previous_crew(self):
+        crew2 = User.objects.create_user(username="delivery2")
+        crew2.groups.add(Group.objects.get(name=DELIVERY_CREW))
+        self.request('patch', f'/api/orders/{self.order.id}', self.manager, {'delivery_crew_id': crew2.id})
+        # Unchanged fields don't log anything
+        self.request('patch', f'/api/orders/{self.order.id}', self.manager, {'delivery_crew_id': crew2.id})
+        self.assertEqual(self.events()[-1], ('assigned', self.order.id, crew2.id, self.crew.id, False))
+        self.assertEqual(len(self.events()), 4)
+        self.assertEqual(OrderEvent.objects.visible_to(self.crew, is_delivery_crew=True).count(), 2)
+
+    async def test_visible_by_role(self):
+        expected = {self.manager: 3, self.crew: 1, self.customer: 2}
+        for user, count in expected.items():
+            with self.subTest(user=user.username):
+                response, events = await self.read(user)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], 'text/event-stream')
+                self.assertEqual(len(events), count)
+
+        _, events = await self.read(self.customer)
+        data = json.loads(events[-1][2])
+        self.assertEqual(events[-1][1], 'assigned')
+        self.assertEqual(
+            (data['order'], data['user'], data['delivery_crew'], data['status']),
+            (self.order.id, self.customer.id, self.crew.id, False)
+        )
+
+    async def test_resumes_after_last_event_id(self):
+        _, events = await self.read(self.manager)
+        response, resumed = await self.read(self.manager, '?timeout=0', **{'Last-Event-ID': events[0][0]})
+        self.assertEqual(resumed, events[1:])
+        response, _ = await self.read(self.manager, '?timeout=0', **{'Last-Event-ID': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_starts_at_the_newest_event(self):
+        response = await self.async_client.get(
+            '/api/orders/events?timeout=0', headers={'Authorization': f'Token {self.tokens[self.customer.id]}'}
+        )
+        # Written after the stream was opened, before its first poll
+        await sync_to_async(self.request)('patch', f'/api/orders/{self.order.id}', self.crew, {'status': True})
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertTrue(body.startswith('retry: '))
+        self.assertEqual(re.findall(r'^event: (\w+)$', body, re.M), ['status'])
+
+
+class SlidingWindowThrottleTests(APITestCase):
+    databases = {'default', 'cache'}
+
+    class MinuteThrottle(UserRateThrottle):
+        rate = '3/minute'
+
+    def setUp(self):
+        self.request = mock.Mock(user=User.objects.create_user(username="customer1"))
+        self.start = 60 * 1000
+
+    def check(self, at, throttle=None):
+        throttle = throttle or self.MinuteThrottle()
+        throttle.timer = lambda: self.start + at
+        return throttle.allow_request(self.request, None), throttle
+
+    def test_limit_slides_over_the_previous_window(self):
+        self.assertEqual([self.check(at)[0] for at in (0, 10, 20, 30)], [True, True, True, False])
+        allowed, throttle = self.check(40)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 20)
+
+        # Half way through the next minute only half of the previous 3 still count
+        self.assertEqual([self.check(90)[0] for _ in range(3)], [True, True, False])
+        self.assertEqual([self.check(110)[0] for _ in range(2)], [True, False])
+
+    def test_state_is_two_counters_per_key(self):
+        for at in range(3):
+            self.check(at)
+        throttle = self.MinuteThrottle()
+        key = throttle.get_cache_key(self.request, None)
+        self.assertEqual(caches[THROTTLE_CACHE].get(f'{key}:{self.start // 60}'), 3)
+
+    def test_counters_are_shared_between_workers(self):
+        # Each worker process has its own cache connection to the shared store
+        for _ in range(3):
+            throttle = self.MinuteThrottle()
+            throttle.cache = caches.create_connection(THROTTLE_CACHE)
+            self.assertTrue(self.check(1, throttle)[0])
+        self.assertFalse(self.check(2)[0])
+
+    def test_throttled_response(self):
+        self.client.force_authenticate(self.request.user)
+        with mock.patch.object(SlidingWindowThrottle, 'timer', return_value=self.start):
+            self.assertEqual(self.client.get('/api/categories').status_code, 200)
+            response = self.client.get('/api/categories')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
@@ -0,0 +1,73 @@
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from rest_framework import throttling
+
+from .metrics import timer
+
+THROTTLE_CACHE = 'throttle'
+
+
+class SlidingWindowThrottle(throttling.SimpleRateThrottle):
+    '''
+    Rate throttle that keeps two counters per key, for the current and the
+    previous fixed window, in the shared `throttle` cache.
+    The request count over the last `duration` seconds is estimated as
+    `previous * (1 - elapsed) + current`, which stays O(1) per check no matter
+    the rate, where DRF's throttles read and rewrite a list with one timestamp
+    per allowed request.
+
+    Counters are bumped with `add`/`incr`. Those are atomic on Redis and
+    Memcached; on the database cache used locally they are read-modify-write,
+    so concurrent requests from different workers may slightly undercount.
+    '''
+    cache = ConnectionProxy(caches, THROTTLE_CACHE)
+
+    def allow_request(self, request, view):
+        with timer('throttle'):
+            if self.rate is None:
+                return True
+            self.key = self.get_cache_key(request, view)
+            if self.key is None:
+                return True
+
+            self.now = self.timer()
+            window, self.elapsed = divmod(self.now / self.duration, 1)
+            current_key = f'{self.key}:{int(window)}'
+            previous_key = f'{self.key}:{int(window) - 1}'
+            counts = self.cache.get_many([current_key, previous_key])
+            self.current = counts.get(current_key, 0)
+            self.previous = counts.get(previous_key, 0)
+
+            if self.previous * (1 - self.elapsed) + self.current >= self.num_requests:
+                return self.throttle_failure()
+            self.count(current_key)
+            return True
+
+    def count(self, key):
+        ''' Adds one to the counter at `key`, it outlives its window so it can serve as `previous` '''
+        timeout = 2 * self.duration
+        if self.current == 0 and self.cache.add(key, 1, timeout):
+            return
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Expired between the read and the increment
+            self.cache.set(key, 1, timeout)
+
+    def wait(self):
+        ''' Seconds until the estimate drops below the limit again '''
+        if self.current < self.num_requests and self.previous:
+            # Within this window, once enough of the previous one has slid out
+            fraction = 1 - (self.num_requests - self.current) / self.previous
+            return max(fraction - self.elapsed, 0) * self.duration
+        # In the next window, once enough of this one has slid out
+        remaining = (1 - self.elapsed) * self.duration
+        return remaining + max(1 - self.num_requests / max(self.current, 1), 0) * self.duration
+
+
+class AnonRateThrottle(SlidingWindowThrottle, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(SlidingWindowThrottle, throttling.UserRateThrottle):
+    pass
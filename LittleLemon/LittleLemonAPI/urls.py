@@ -1,20 +1,40 @@
 from django.urls import path
 
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('categories', views.CategoryListCreateView.as_view()),
     path('categories/<int:pk>', views.CategoryRUDView.as_view()),
     path('menu-items', views.MenuItemListCreateView.as_view()),
     path('menu-items/<int:pk>', views.MenuItemRUDView.as_view()),
+    path('menu-items/bulk', views.MenuItemBulkView.as_view()),
 
     path('cart/menu-items', views.CartAPIView.as_view()),
+    path('cart/menu-items/batch', views.CartBatchAPIView.as_view()),
 
     path('orders', views.OrderView.as_view()),
     path('orders/<int:pk>', views.OrderView.as_view()),
+    path('orders/export', views.OrderExportView.as_view()),
+    path('orders/events', async_views.AsyncOrderEventsView.as_view()),
+
+    path('dispatch', views.DispatchView.as_view()),
+    path('dispatch/balance', views.DispatchBalanceView.as_view()),
+
+    path('reports/sales', views.SalesReportView.as_view()),
 
     path('groups/manager/users', views.list_create_managers),
     path('groups/manager/users/<int:pk>', views.remove_manager),
+    path('groups/manager/users/bulk', views.bulk_managers),
     path('groups/delivery-crew/users', views.list_create_delivery_crew),
     path('groups/delivery-crew/users/<int:pk>', views.remove_delivery_crew),
+    path('groups/delivery-crew/users/bulk', views.bulk_delivery_crew),
+
+    # Async read paths for ASGI deployments
+    path('async/categories', async_views.AsyncCategoryView.as_view()),
+    path('async/categories/<int:pk>', async_views.AsyncCategoryView.as_view()),
+    path('async/menu-items', async_views.AsyncMenuItemView.as_view()),
+    path('async/menu-items/<int:pk>', async_views.AsyncMenuItemView.as_view()),
+    path('async/cart/menu-items', async_views.AsyncCartView.as_view()),
+    path('async/orders', async_views.AsyncOrderView.as_view()),
+    path('async/orders/<int:pk>', async_views.AsyncOrderView.as_view()),
 ]
\ No newline at end of file
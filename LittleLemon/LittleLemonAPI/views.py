@@ -1,8 +1,11 @@
 import datetime
 
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from django.shortcuts import get_object_or_404
-from django.contrib.auth.models import User, Group
-from django.core.exceptions import ObjectDoesNotExist
+from django.contrib.auth.models import User
 
 from rest_framework.generics import (
     ListCreateAPIView,
@@ -10,75 +13,144 @@ from rest_framework.generics import (
 )
 from rest_framework import status
 from rest_framework.views import APIView
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 
 from .serializers import (
     MenuItemSerializer,
     CategorySerializer,
-    UserSerializer,
-    CartSerializer,
-    OrderSerializer
+    OrderSerializer,
+    parse_field_options
 )
-from .models import MenuItem, Category, CartItem, Order, OrderItem
+from .models import MenuItem, Category, CartItem, Order, OrderEvent, OrderItem, DailySales
+from .caching import CatalogCacheMixin, bump_catalog_version
+from .exports import CSVRenderer, NDJSONRenderer, export_rows
+from .idempotency import idempotent
+from .pagination import DispatchPagination, KeysetPagination, OrderPagination
+from . import dispatch
+from .rendering import CART, MENUITEM, ORDER, USER
 from .permissions import IsManager, IsDeliveryCrew
+from .search import MenuSearchFilter, get_backend
+from .roles import MANAGER, DELIVERY_CREW, add_members, get_group, get_roles, remove_members
+from .throttling import AnonRateThrottle, UserRateThrottle
+
+def date_range_filters(query_params, field='date'):
+    '''
+    Filters for the optional `?start=` / `?end=` (YYYY-MM-DD, inclusive) params.
+    Raises ValueError with a client facing message.
+    '''
+    filters = {}
+    for param, lookup in (('start', 'gte'), ('end', 'lte')):
+        if param in query_params:
+            date = parse_date(query_params[param])
+            if date is None:
+                raise ValueError(f"Invalid {param} date, expected YYYY-MM-DD")
+            filters[f'{field}__{lookup}'] = date
+    return filters
+
 
 # -------------- Cart  -----------------
 # --------------------------------------
+def parse_cart_line(data):
+    '''
+    Returns `(menuitem_id, quantity)` from a cart payload, quantity defaults to 1.
+    Raises ValueError with a client facing message.
+    '''
+    menuitem_id = data.get('menuitem')
+    if not menuitem_id:
+        raise ValueError("MenuItem ID field required (menuitem)")
+    try:
+        menuitem_id = int(menuitem_id)
+        quantity = int(data.get("quantity") or 1)
+    except Exception as e:
+        raise ValueError(f"{type(e).__name__}:{e}")
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1")
+    return menuitem_id, quantity
+
+
 class CartAPIView(APIView):
     permission_classes = [IsAuthenticated]
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
     def get(self, request):
+        shape = CART.select(*parse_field_options(request))
         cart_items = CartItem.objects.filter(user=request.user.id)
-        serialized_data = CartSerializer(cart_items, many=True).data
-        return Response(serialized_data)
+        return Response(shape.render(shape.values(cart_items)))
     
     def delete(self, request):
         cart_items = CartItem.objects.filter(user=request.user.id)
         cart_items.delete()
         return Response({"details": "ok"}, status.HTTP_204_NO_CONTENT)
 
+    @idempotent
     def post(self, request):
-        data = request.data.copy()
-
-        menuitem_id = data.get('menuitem')
-        if not menuitem_id:
-            return Response(
-                {"details": "MenuItem ID field required (menuitem)"},
-                status.HTTP_400_BAD_REQUEST
-            )
-
-        if not data.get("quantity"):
-            data["quantity"] = 1
-        try:
-            quantity = int(data["quantity"])
-        except Exception as e:
-            return Response({"details": f"{type(e).__name__}:{e}"}, status.HTTP_400_BAD_REQUEST)
-        if quantity < 1:
-            return Response({"details": "Quantity must be at least 1"}, status.HTTP_400_BAD_REQUEST)
-        
         try:
-            cart_item = CartItem.objects.get(menuitem=menuitem_id, user=request.user.id)
-        except ObjectDoesNotExist:
-            get_object_or_404(MenuItem, pk=menuitem_id)
-            data['user_id'] = request.user.id
-            data['menuitem_id'] = menuitem_id
-            data['quantity'] = quantity
-            cart_serializer = CartSerializer(data=data)
-            if cart_serializer.is_valid():
-                cart_serializer.save()
-            else:
-                return Response(cart_serializer.errors, status.HTTP_400_BAD_REQUEST)
+            menuitem_id, quantity = parse_cart_line(request.data)
+        except ValueError as e:
+            return Response({"details": str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        menuitem_prices = MenuItem.objects.values_list('price', flat=True)
+        unit_price = get_object_or_404(menuitem_prices, pk=menuitem_id)
+        created = CartItem.objects.add(request.user.id, menuitem_id, unit_price, quantity)
+        if created:
             return Response({"details": "ok"}, status.HTTP_201_CREATED)
-        
-        cart_item.quantity += quantity
-        cart_item.price = cart_item.quantity * cart_item.unit_price
-        cart_item.save()
         return Response({"details": "ok"}, status.HTTP_202_ACCEPTED)
 
+
+class CartBatchAPIView(APIView):
+    '''
+    Adds many menu items in one request.
+    Expects a list of `{"menuitem": <id>, "quantity": <int>}` and answers with
+    one result per line; invalid lines are reported and the rest still applied.
+    '''
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    max_lines = 100
+
+    @idempotent
+    def post(self, request):
+        if not isinstance(request.data, list) or not request.data:
+            return Response({"details": "Expected a list of cart items"}, status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.max_lines:
+            errmsg = f"At most {self.max_lines} cart items per request"
+            return Response({"details": errmsg}, status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for line in request.data:
+            try:
+                if not isinstance(line, dict):
+                    raise ValueError("Expected an object")
+                menuitem_id, quantity = parse_cart_line(line)
+                results.append({"menuitem": menuitem_id, "quantity": quantity})
+            except ValueError as e:
+                results.append({"status": "error", "details": str(e)})
+
+        menuitem_ids = {result["menuitem"] for result in results if "menuitem" in result}
+        prices = dict(MenuItem.objects.filter(pk__in=menuitem_ids).values_list('id', 'price'))
+
+        lines = {}
+        for result in results:
+            menuitem_id = result.get("menuitem")
+            if menuitem_id is None:
+                continue
+            if menuitem_id not in prices:
+                result.update(status="error", details="MenuItem not found")
+                continue
+            _, quantity = lines.get(menuitem_id, (None, 0))
+            lines[menuitem_id] = (prices[menuitem_id], quantity + result["quantity"])
+
+        created = CartItem.objects.add_many(request.user.id, lines) if lines else set()
+        for result in results:
+            if result.get("menuitem") in lines:
+                result["status"] = "created" if result["menuitem"] in created else "updated"
+
+        if not lines:
+            return Response(results, status.HTTP_400_BAD_REQUEST)
+        return Response(results)
+
             
 
 # -------------- Orders  -----------------
@@ -91,21 +163,25 @@ class OrderView(APIView):
 
     def get(self, request, pk=None):
         is_manager = IsManager().has_permission(request)
+        shape = ORDER.select(*parse_field_options(request))
+        orders = Order.objects.all()
 
         if pk is None:
-            if is_manager:
-                orders = Order.objects.all()
-            elif IsDeliveryCrew().has_permission(request):
-                orders = Order.objects.filter(delivery_crew=request.user.id)
-            else:
-                orders = Order.objects.filter(user=request.user.id)
-            serialized_data = OrderSerializer(orders, many=True).data
-            return Response(serialized_data)
+            if not is_manager and IsDeliveryCrew().has_permission(request):
+                orders = orders.filter(delivery_crew=request.user.id)
+            elif not is_manager:
+                orders = orders.filter(user=request.user.id)
+            rows = shape.values(orders)
+            paginator = OrderPagination()
+            page = paginator.paginate_queryset(rows, request, view=self)
+            if page is None:
+                return Response(shape.render(rows))
+            return paginator.get_paginated_response(shape.render(page))
         
-        order = get_object_or_404(Order, id=pk)        
-        if not is_manager and order.user.id != request.user.id: #type:ignore
+        order = get_object_or_404(shape.values(orders, 'user_id'), id=pk)
+        if not is_manager and order['user_id'] != request.user.id:
             return Response({'details': "Not Authorized"}, status.HTTP_403_FORBIDDEN)
-        return Response(OrderSerializer(order).data)
+        return Response(shape.render([order])[0])
     
 
 
@@ -137,12 +213,10 @@ class OrderView(APIView):
         if serializer.is_valid():
             delivery_crew_user = serializer.validated_data.get("delivery_crew") #type:ignore
             if delivery_crew_user:
-                user = get_object_or_404(User, id=delivery_crew_user.id)
-                user_is_delivery = user.groups.filter(name="Delivery crew").exists()
-                if not user_is_delivery:
+                if DELIVERY_CREW not in get_roles(delivery_crew_user):
                     errmsg = f'User ID <{delivery_crew_user.id}> is not part of the Delivery crew' #type:ignore
                     return Response({'details': errmsg}, status.HTTP_400_BAD_REQUEST)
-            serializer.save()
+            self.save_with_events(serializer, order)
             return Response({"details": "ok"})
 
         return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
@@ -157,36 +231,56 @@ class OrderView(APIView):
             return Response({'details': errmsg}, status.HTTP_403_FORBIDDEN)
         serializer = OrderSerializer(order, data=order_status, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            self.save_with_events(serializer, order)
             return Response({"details": "ok"})
         else:
             return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
 
+    def save_with_events(self, serializer, order):
+        ''' Saves the order and logs its assignment/status changes for the event stream '''
+        delivery_crew_id, order_status = order.delivery_crew_id, order.status
+        with transaction.atomic():
+            serializer.save()
+            OrderEvent.objects.bulk_create(OrderEvent.for_changes(order, delivery_crew_id, order_status))
+
 
 
+    @idempotent
     def post(self, request):
-        cart_items = CartItem.objects.filter(user=request.user.id)
-        if not cart_items:
-            return Response({"details": "No items in cart!"}, status.HTTP_400_BAD_REQUEST)
-        
-        data = {'user_id': request.user.id, 'date': datetime.date.today()}
-        context = {'cart_items': cart_items}
-        order_serializer = OrderSerializer(data=data, context=context)
-        if order_serializer.is_valid():
-            new_order = order_serializer.save()
-        else:
-            return Response(order_serializer.errors, status.HTTP_400_BAD_REQUEST)
-        
-        for c_item in cart_items:
-            OrderItem.objects.create(
-                order=new_order,
-                menuitem=MenuItem.objects.get(pk=c_item.menuitem.id), #type:ignore
-                quantity=c_item.quantity,
-                unit_price=c_item.unit_price,
-                price=c_item.price
+        with transaction.atomic():
+            # The order, its total and the cart cleanup all work off these rows,
+            # a line added to the cart meanwhile stays in the cart
+            cart_lines = list(
+                CartItem.objects.filter(user=request.user.id).select_for_update(of=('self',))
+                .values_list('id', 'menuitem_id', 'menuitem__category_id', 'quantity', 'unit_price', 'price')
             )
-            
-        cart_items.delete()
+            if not cart_lines:
+                return Response({"details": "No items in cart!"}, status.HTTP_400_BAD_REQUEST)
+
+            data = {'user_id': request.user.id, 'date': datetime.date.today()}
+            context = {'total': sum(price for *_, price in cart_lines)}
+            order_serializer = OrderSerializer(data=data, context=context)
+            if order_serializer.is_valid():
+                new_order = order_serializer.save()
+            else:
+                return Response(order_serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=new_order,
+                    menuitem_id=menuitem_id,
+                    quantity=quantity,
+                    unit_price=unit_price,
+                    price=price
+                )
+                for _, menuitem_id, _, quantity, unit_price, price in cart_lines
+            ])
+            DailySales.objects.record(new_order.date, [
+                (menuitem_id, category_id, quantity, price)
+                for _, menuitem_id, category_id, quantity, _, price in cart_lines
+            ])
+            CartItem.objects.filter(id__in=[cart_line[0] for cart_line in cart_lines]).delete()
+            OrderEvent.for_order(OrderEvent.CREATED, new_order).save()
         return Response({"details": "ok"}, status.HTTP_201_CREATED)
 
 
@@ -201,12 +295,188 @@ class OrderView(APIView):
                 status.HTTP_400_BAD_REQUEST
             )
         
-        order = Order.objects.filter(id=pk)
-        order.delete()
+        with transaction.atomic():
+            order = Order.objects.filter(id=pk).first()
+            if order:
+                order_lines = order.orderitem_set.values_list(
+                    'menuitem_id', 'menuitem__category_id', 'quantity', 'price'
+                )
+                DailySales.objects.record(order.date, order_lines, sign=-1)
+                OrderEvent.for_order(OrderEvent.DELETED, order).save()
+                order.delete()
         return Response({"details": "ok"}, status.HTTP_204_NO_CONTENT) 
 
 
 
+# -------------- Reports  -----------------
+# ----------------------------------------
+class SalesReportView(APIView):
+    '''
+    Sales totals read from the precomputed `DailySales` rows.
+    `?group_by=day|category|menuitem`, optional `?start=` / `?end=` (YYYY-MM-DD)
+    and `?category=<id>` filters.
+    '''
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    groupings = {
+        'day': ('date', {}),
+        'category': ('category', {'title': F('category__title')}),
+        'menuitem': ('menuitem', {'title': F('menuitem__title')}),
+    }
+
+    def get(self, request):
+        group_by = request.query_params.get('group_by', 'day')
+        if group_by not in self.groupings:
+            errmsg = f"group_by must be one of: {', '.join(self.groupings)}"
+            return Response({'details': errmsg}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            sales = DailySales.objects.filter(**date_range_filters(request.query_params))
+            if 'category' in request.query_params:
+                sales = sales.filter(category_id=int(request.query_params['category']))
+        except ValueError as e:
+            return Response({'details': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        field, extra = self.groupings[group_by]
+        report = (
+            sales.values(field, **extra)
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .order_by(field)
+        )
+        return Response(report)
+
+
+class OrderExportView(APIView):
+    '''
+    Streams every order with its items for back-office ingestion, optionally
+    limited to `?start=` / `?end=` (YYYY-MM-DD) on the order date.
+    NDJSON (one order per line) by default, CSV (one item per row) with
+    `?format=csv` or `Accept: text/csv`.
+    '''
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request):
+        try:
+            orders = Order.objects.filter(**date_range_filters(request.query_params))
+        except ValueError as e:
+            return Response({'details': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(export_rows(orders)), content_type=renderer.media_type
+        )
+        filename = '-'.join(['orders'] + [
+            request.query_params[param] for param in ('start', 'end') if param in request.query_params
+        ])
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{renderer.format}"'
+        return response
+
+
+
+# -------------- Dispatch  -----------------
+# ------------------------------------------
+class DispatchView(APIView):
+    '''
+    Pending orders and crew workload, for managers.
+    GET lists pending orders oldest first (`?crew=<id>` or `?unassigned=true`
+    narrow it) with every crew member's pending count and the unassigned count.
+    POST assigns orders in bulk from a list of `{"order": <id>, "delivery_crew": <id>}`
+    and answers with one result per row; invalid rows are reported and the rest still applied.
+    '''
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    max_rows = 1000
+
+    def get(self, request):
+        orders = Order.objects.filter(status=False)
+        try:
+            if 'crew' in request.query_params:
+                orders = orders.filter(delivery_crew=int(request.query_params['crew']))
+        except ValueError:
+            return Response({'details': "crew must be a user ID"}, status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('unassigned') == 'true':
+            orders = orders.filter(delivery_crew=None)
+
+        shape = ORDER.select(*parse_field_options(request))
+        paginator = DispatchPagination()
+        page = paginator.paginate_queryset(shape.values(orders), request, view=self)
+        response = paginator.get_paginated_response(shape.render(page))
+        response.data['crew'] = list(dispatch.crew_load())
+        response.data['unassigned'] = Order.objects.filter(status=False, delivery_crew=None).count()
+        return response
+
+    def post(self, request):
+        if not isinstance(request.data, list) or not request.data:
+            return Response({"details": "Expected a list of assignments"}, status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.max_rows:
+            errmsg = f"At most {self.max_rows} assignments per request"
+            return Response({"details": errmsg}, status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for row in request.data:
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError("Expected an object")
+                results.append({"order": int(row['order']), "delivery_crew": int(row['delivery_crew'])})
+            except KeyError as e:
+                results.append({"status": "error", "details": f"{e.args[0]} field required"})
+            except (TypeError, ValueError) as e:
+                results.append({"status": "error", "details": f"{type(e).__name__}:{e}"})
+
+        order_ids = {result["order"] for result in results if "order" in result}
+        crew_ids = {result["delivery_crew"] for result in results if "delivery_crew" in result}
+        with transaction.atomic():
+            delivered = dict(Order.objects.select_for_update().filter(id__in=order_ids).values_list('id', 'status'))
+            crew = dispatch.valid_crew(crew_ids)
+
+            assignments = {}
+            for result in results:
+                if "order" not in result:
+                    continue
+                if result["order"] not in delivered:
+                    result.update(status="error", details="Order not found")
+                elif delivered[result["order"]]:
+                    result.update(status="error", details="Order already delivered")
+                elif result["delivery_crew"] not in crew:
+                    errmsg = f'User ID <{result["delivery_crew"]}> is not part of the Delivery crew'
+                    result.update(status="error", details=errmsg)
+                elif result["order"] in assignments:
+                    result.update(status="error", details="Order assigned more than once")
+                else:
+                    assignments[result["order"]] = result["delivery_crew"]
+                    result["status"] = "assigned"
+            dispatch.assign(assignments)
+
+        if not assignments:
+            return Response(results, status.HTTP_400_BAD_REQUEST)
+        return Response(results)
+
+
+class DispatchBalanceView(APIView):
+    '''
+    Assigns pending, unassigned orders to the least loaded crew members, oldest first.
+    Takes every such order, or only those listed in `{"orders": [<id>, ...]}`.
+    '''
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+
+    def post(self, request):
+        order_ids = request.data.get('orders') if isinstance(request.data, dict) else None
+        # bool is an int too, and a string of digits would be iterated digit by digit
+        if order_ids is not None and not (
+            isinstance(order_ids, list)
+            and all(isinstance(order_id, int) and not isinstance(order_id, bool) for order_id in order_ids)
+        ):
+            return Response({"details": "orders must be a list of order IDs"}, status.HTTP_400_BAD_REQUEST)
+        assignments = dispatch.balance(order_ids)
+        return Response([
+            {"order": order_id, "delivery_crew": crew_id} for order_id, crew_id in assignments.items()
+        ])
+
+
+
 # ----- Categories and Menu Items  -------
 # --------------------------------------
 class ManagerOnlyListCreateView(ListCreateAPIView):
@@ -226,45 +496,244 @@ class ManagerOnlyRUDView(RetrieveUpdateDestroyAPIView):
         return [permission() for permission in permission_classes]
 
 
-class CategoryListCreateView(ManagerOnlyListCreateView):
+class CategoryListCreateView(CatalogCacheMixin, ManagerOnlyListCreateView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    # Spelled out for `AsyncCategoryView`, which has no serializer to default to
+    ordering_fields = ['id', 'slug', 'title']
 
-class CategoryRUDView(ManagerOnlyRUDView):
+class CategoryRUDView(CatalogCacheMixin, ManagerOnlyRUDView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
 
-class MenuItemListCreateView(ManagerOnlyListCreateView):
-    queryset = MenuItem.objects.all()
+class MenuItemReadMixin:
+    '''
+    Renders reads with `rendering.MENUITEM` straight from `.values()` rows and
+    joins the category only when the representation nests it.
+    Goes after `CatalogCacheMixin`, which caches what these return.
+    '''
+    # Writes answer through `MenuItemSerializer`, which nests the category;
+    # `.values()` drops the join for reads
+    queryset = MenuItem.objects.select_related('category')
+
+    def list(self, request, *args, **kwargs):
+        shape = MENUITEM.select(*parse_field_options(request))
+        rows = shape.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(shape.render(rows))
+        return self.get_paginated_response(shape.render(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        shape = MENUITEM.select(*parse_field_options(request))
+        row = get_object_or_404(shape.values(self.get_queryset()), pk=kwargs['pk'])
+        return Response(shape.render([row])[0])
+
+
+class MenuItemListCreateView(CatalogCacheMixin, MenuItemReadMixin, ManagerOnlyListCreateView):
     serializer_class = MenuItemSerializer
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    pagination_class = KeysetPagination
+    filter_backends = [MenuSearchFilter, OrderingFilter]
     ordering_fields = ['price']
-    search_fields = ['category__slug', 'category__slug']
     
-class MenuItemRUDView(ManagerOnlyRUDView):
-    queryset = MenuItem.objects.all()
+class MenuItemRUDView(CatalogCacheMixin, MenuItemReadMixin, ManagerOnlyRUDView):
     serializer_class = MenuItemSerializer
     throttle_classes = [AnonRateThrottle, UserRateThrottle]
 
+    def perform_destroy(self, instance):
+        menuitem_id = instance.id
+        super().perform_destroy(instance)
+        get_backend().remove([menuitem_id])
+
+
+class MenuItemBulkView(APIView):
+    '''
+    Applies many menu changes in one request and one transaction.
+    Expects a list of `{"op": "create", <fields>}`, `{"op": "update", "id": <id>, <fields>}`
+    and `{"op": "delete", "id": <id>}` and answers with one result per row;
+    invalid rows are reported and the rest still applied.
+    '''
+    permission_classes = [IsAuthenticated, IsManager]
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    max_rows = 1000
+    ops = ('create', 'update', 'delete')
+
+    def post(self, request):
+        if not isinstance(request.data, list) or not request.data:
+            return Response({"details": "Expected a list of menu item changes"}, status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.max_rows:
+            errmsg = f"At most {self.max_rows} menu item changes per request"
+            return Response({"details": errmsg}, status.HTTP_400_BAD_REQUEST)
+
+        changes, seen_ids = [], set()
+        for row in request.data:
+            try:
+                change = self.parse_change(row)
+                if change['id'] in seen_ids:
+                    raise ValueError(f"MenuItem ID <{change['id']}> appears more than once")
+                if change['id'] is not None:
+                    seen_ids.add(change['id'])
+                changes.append(change)
+            except ValueError as e:
+                changes.append({"status": "error", "details": e.args[0]})
+
+        category_ids = {
+            change['data']['category_id'] for change in changes if 'category_id' in change.get('data', {})
+        }
+        categories = set(Category.objects.filter(id__in=category_ids).values_list('id', flat=True))
+
+        with transaction.atomic():
+            # Locked until the commit, updates apply to the rows as they are now
+            menuitems = MenuItem.objects.select_for_update().in_bulk(seen_ids)
+            for change in changes:
+                if change.get('status') == 'error':
+                    continue
+                category_id = change.get('data', {}).get('category_id')
+                if change['op'] != 'create' and change['id'] not in menuitems:
+                    change.update(status="error", details="MenuItem not found")
+                elif category_id is not None and category_id not in categories:
+                    change.update(status="error", details=f"Category ID <{category_id}> not found")
+
+            valid = [change for change in changes if change.get('status') != 'error']
+            if not valid:
+                return Response(self.results(changes), status.HTTP_400_BAD_REQUEST)
+
+            self.apply(valid, menuitems)
+            # Bulk writes don't send the signals that keep the search index current,
+            # and deletes never do
+            search = get_backend()
+            search.index([change['id'] for change in valid if change['op'] != 'delete'])
+            search.remove([change['id'] for change in valid if change['op'] == 'delete'])
+        bump_catalog_version()
+        return Response(self.results(changes))
+
+    def parse_change(self, row):
+        ''' Returns `{"op", "id", "data"}` with validated fields, raises ValueError with the row's errors '''
+        if not isinstance(row, dict):
+            raise ValueError("Expected an object")
+        op = row.get('op')
+        if op not in self.ops:
+            raise ValueError(f"op must be one of: {', '.join(self.ops)}")
+
+        menuitem_id = None
+        if op != 'create':
+            try:
+                menuitem_id = int(row['id'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("MenuItem ID field required (id)")
+        if op == 'delete':
+            return {'op': op, 'id': menuitem_id}
+
+        fields = {key: value for key, value in row.items() if key not in ('op', 'id')}
+        if not fields:
+            raise ValueError("No fields to update")
+        serializer = MenuItemSerializer(data=fields, partial=op == 'update')
+        if not serializer.is_valid():
+            raise ValueError(serializer.errors)
+        return {'op': op, 'id': menuitem_id, 'data': serializer.validated_data}
+
+    def apply(self, changes, menuitems):
+        creates = [change for change in changes if change['op'] == 'create']
+        created = MenuItem.objects.bulk_create([MenuItem(**change['data']) for change in creates])
+        for change, menuitem in zip(creates, created):
+            change.update(id=menuitem.id, status="created")
+
+        # One UPDATE per set of fields, so no row writes back fields it didn't send
+        updates = {}
+        for change in changes:
+            if change['op'] == 'update':
+                menuitem = menuitems[change['id']]
+                for field, value in change['data'].items():
+                    setattr(menuitem, field, value)
+                updates.setdefault(tuple(sorted(change['data'])), []).append(menuitem)
+                change['status'] = "updated"
+        for fields, updated in updates.items():
+            MenuItem.objects.bulk_update(updated, fields, batch_size=500)
+
+        deleted = [change['id'] for change in changes if change['op'] == 'delete']
+        if deleted:
+            MenuItem.objects.filter(id__in=deleted).delete()
+            for change in changes:
+                if change['op'] == 'delete':
+                    change['status'] = "deleted"
+
+    def results(self, changes):
+        return [
+            {"status": change['status'], "details": change['details']} if change['status'] == 'error'
+            else {"status": change['status'], "id": change['id']}
+            for change in changes
+        ]
+
 
 
 
 
 # ----- Group Management --------------
 # -------------------------------------
+def list_group_members(request, group):
+    ''' Paginated members of `group` '''
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(USER.values(group.user_set.all()), request)
+    return paginator.get_paginated_response(USER.render(page))
+
+
+def update_group_members(request, group, max_rows=1000):
+    '''
+    Adds and removes members of `group` in bulk from `{"add": [<username>, ...], "remove": [...]}`.
+    Usernames are resolved with one query, then there's one INSERT and one DELETE
+    on the membership table. Answers with one result per username; unknown
+    usernames are reported and the rest are still applied.
+    '''
+    if not isinstance(request.data, dict):
+        return Response({"details": "Expected an object with add and/or remove"}, status.HTTP_400_BAD_REQUEST)
+    changes = {op: request.data.get(op, []) for op in ('add', 'remove')}
+    if not all(isinstance(usernames, list) for usernames in changes.values()):
+        return Response({"details": "add and remove must be lists of usernames"}, status.HTTP_400_BAD_REQUEST)
+    if not changes['add'] and not changes['remove']:
+        return Response({"details": "Nothing to add or remove"}, status.HTTP_400_BAD_REQUEST)
+    if len(changes['add']) + len(changes['remove']) > max_rows:
+        errmsg = f"At most {max_rows} usernames per request"
+        return Response({"details": errmsg}, status.HTTP_400_BAD_REQUEST)
+
+    usernames = [username for op in changes.values() for username in op if isinstance(username, str)]
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    results, member_ids, seen = [], {'add': [], 'remove': []}, set()
+    for op, done in (('add', 'added'), ('remove', 'removed')):
+        for username in changes[op]:
+            if not isinstance(username, str):
+                results.append({"username": username, "status": "error", "details": "Expected a username"})
+            elif username not in user_ids:
+                results.append({"username": username, "status": "error", "details": "User not found"})
+            elif username in seen:
+                results.append({"username": username, "status": "error", "details": "Username listed more than once"})
+            else:
+                seen.add(username)
+                member_ids[op].append(user_ids[username])
+                results.append({"username": username, "id": user_ids[username], "status": done})
+
+    if not seen:
+        return Response(results, status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        if member_ids['add']:
+            add_members(group, member_ids['add'])
+        if member_ids['remove']:
+            remove_members(group, member_ids['remove'])
+    return Response(results)
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsManager])
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
 def list_create_managers(request):
-    manager_group = Group.objects.get(name="Manager")
+    manager_group = get_group(MANAGER)
 
     if request.method == "GET":
-        managers = manager_group.user_set.all()
-        user_serializer = UserSerializer(managers, many=True)
-        return Response(user_serializer.data)
+        return list_group_members(request, manager_group)
     
     if request.method == "POST":
         username = request.data['username']
@@ -279,12 +748,10 @@ def list_create_managers(request):
 @permission_classes([IsManager])
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
 def list_create_delivery_crew(request):
-    manager_group = Group.objects.get(name="Delivery crew")
+    manager_group = get_group(DELIVERY_CREW)
 
     if request.method == "GET":
-        managers = manager_group.user_set.all()
-        user_serializer = UserSerializer(managers, many=True)
-        return Response(user_serializer.data)
+        return list_group_members(request, manager_group)
     
     if request.method == "POST":
         username = request.data['username']
@@ -295,12 +762,24 @@ def list_create_delivery_crew(request):
         else:
             return Response({"details": "Bad Request"}, status.HTTP_400_BAD_REQUEST)    
 
+@api_view(['POST'])
+@permission_classes([IsManager])
+@throttle_classes([AnonRateThrottle, UserRateThrottle])
+def bulk_managers(request):
+    return update_group_members(request, get_group(MANAGER))
+
+@api_view(['POST'])
+@permission_classes([IsManager])
+@throttle_classes([AnonRateThrottle, UserRateThrottle])
+def bulk_delivery_crew(request):
+    return update_group_members(request, get_group(DELIVERY_CREW))
+
 @api_view(['DELETE'])
 @permission_classes([IsManager])
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
 def remove_manager(request, pk):
     user = get_object_or_404(User, id=pk)    
-    manager_group = Group.objects.get(name="Manager")
+    manager_group = get_group(MANAGER)
     manager_group.user_set.remove(user)
     return Response({"detail": "ok"})
 
@@ -309,6 +788,6 @@ def remove_manager(request, pk):
 @throttle_classes([AnonRateThrottle, UserRateThrottle])
 def remove_delivery_crew(request, pk):
     user = get_object_or_404(User, id=pk)
-    deliver_crew_group = Group.objects.get(name="Delivery crew")
+    deliver_crew_group = get_group(DELIVERY_CREW)
     deliver_crew_group.user_set.remove(user)
     return Response({"detail": "ok"})
\ No newline at end of file